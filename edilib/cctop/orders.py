@@ -7,7 +7,8 @@ Created by Maximillian Dornseif 2008-08-12."""
 
 import datetime
 from edilib.recordbased import generate_field_datensatz_class, FixedField, DecimalField, IntegerField
-from edilib.recordbased import DateField, EanField, TimeField
+from edilib.recordbased import DateField, EanField, TimeField, iter_lines, build_index as build_recordindex
+from edilib.recordbased import validate_file as validate_recordfile
 from decimal import Decimal
 
 
@@ -722,17 +723,36 @@ recordhandlers = {
 }
 
 
+def build_index(data):
+    """Build a edilib.recordbased.RecordIndex for a StratEDI ORDERS file (string or mmap).
+
+    Every order starts with a 100 record. Use parse_rawdata(index.get_message(data, n)) to parse
+    only the n-th order together with the interchange header."""
+    return build_recordindex(data, (0, 3), ['100'])
+
+
+def validate_file(data):
+    """Check a StratEDI ORDERS file (string, mmap or iterable of lines) without parsing it.
+
+    Lines are padded or truncated to 512 bytes like parse_rawdata() does, so their length is not checked.
+    Returns a list of (lineno, column, fieldname, message) for every violation, see
+    edilib.recordbased.validate_file()."""
+    return validate_recordfile(data, ordersparser, (0, 3), pad=True)
+
+
 def parse_rawdata(data):
     """Parses a Stratedi ORDERS file and returns a objects following the AuftragsProtokoll.
 
     In fact it returns (header, [Auftrag, Auftrag, ...]).
+    data can be the content of the file as string or mmap or an iterable of lines, e.g. from
+    edilib.recordbased.mmap_lines().
     """
 
     header = None
     parsers = []
     auftraege = []
     orderdict = {'positionen': [], 'abschlaege': []}
-    for line in data.split('\n'):
+    for line in iter_lines(data):
         line = line.strip('\r\n')
         if not line:
             # empty line
@@ -45,11 +45,24 @@ See docstrings for further explanation.
 """
 
 
+import array
 import datetime
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
 import time
 from decimal import Decimal
 from huTools import checksumming
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class RecordBasedProtocolException(Exception):
     """All Exceptions thrown by this module are descendants of this."""
@@ -91,24 +104,94 @@ class InvalidData(ParseException, ValueError):
     pass
 
 
+# marks values of lazily parsed records which are not decoded yet
+_PENDING = object()
+
+# generated record classes by their module qualified name, used for unpickling records
+_record_classes = {}
+
+# recently parsed dates and times by format, shared by all DateFields and TimeFields
+_parse_caches = {}
+# start positions of year, month and day in the date formats parsed without time.strptime()
+_date_layouts = {'%Y%m%d': (0, 4, 6), '%d%m%Y': (4, 2, 0)}
+
+
+class _LRUCache(object):
+    """Remembers the results of 'function' for the 'size' most recently used arguments.
+
+    Calls are serialized by a lock, so the cache can be shared by threads."""
+
+    def __init__(self, function, size):
+        self.function = function
+        self.size = size
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Forget all remembered results."""
+        with self._lock:
+            self._links = {}
+            # circular doubly linked list of [previous, next, argument, result] - the oldest entry follows
+            # the root
+            self._root = []
+            self._root[:] = [self._root, self._root, None, None]
+
+    def __len__(self):
+        return len(self._links)
+
+    def __call__(self, argument):
+        with self._lock:
+            root = self._root
+            link = self._links.get(argument)
+            if link is None:
+                result = self.function(argument)
+                if len(self._links) >= self.size:
+                    oldest = root[1]
+                    root[1] = oldest[1]
+                    oldest[1][0] = root
+                    del self._links[oldest[2]]
+                link = self._links[argument] = [None, None, argument, result]
+            else:
+                link[0][1] = link[1]
+                link[1][0] = link[0]
+            # move to the end of the list, where the most recently used entries are
+            link[0] = last = root[0]
+            link[1] = root
+            last[1] = root[0] = link
+            return link[3]
+
+
+# check digits of recently seen EANs and ILNs, shared by all EanFields and validate_eans()
+_checkdigits = _LRUCache(checksumming.ean_digit, 8192)
+
+
 class FieldDescriptor(object):
-    """Implements descriptor protocol access for Fields."""
+    """Implements descriptor protocol access for Fields.
 
-    def __init__(self, name, length=5, default='', choices=tuple(), doc=None, **kwargs):
+    The values live in the value vector of the record instance, the Field instance shared by all
+    records of a class is only used for validating them."""
+
+    def __init__(self, name, index, field):
         self.name = name
-        self.doc = doc
-        self.value = None
+        self.index = index
+        self.field = field
+        self.doc = field.doc
 
     def __str__(self):
-        return str(self.value)
+        return self.name
 
     # methods used for the descriptor protocol. See http://docs.python.org/ref/descriptors.html
 
     def __get__(self, obj, objtype):
-        return getattr(obj, self.name + '_field').value
+        if obj is None:
+            return self
+        value = obj._values[self.index]
+        if value is _PENDING:
+            return obj._decode_field(self.index)
+        return value
 
     def __set__(self, obj, value):
-        return getattr(obj, self.name + '_field').set(value)
+        obj._values[self.index] = self.field.clean(value)
 
 
 class Field(object):
@@ -121,6 +204,10 @@ class Field(object):
     If default is a callable it is called to get the default value.
     If 'choices' is used, the system enforces that only values present in 'choices' are allowed.
     Attempts to set an other value will result un an Exception.
+
+    Records generated by generate_field_datensatz_class() share one Field instance per field and class
+    and only use its stateless methods clean(), decode(), format() and text(). The 'value' attribute and
+    get(), set() and parse() are for using a Field on it's own.
     """
 
     def __init__(self, name, length=5, default='', choices=tuple(), doc=None):
@@ -128,25 +215,39 @@ class Field(object):
         self.length = length
         self.default = default
         self.value = default
+        self._compile_formats()
         self.choices = [self.format(x) for x in choices]
         self.doc = doc
 
+    def _compile_formats(self):
+        """Build the format strings used by format() once instead of on every call."""
+        self._leftformat = "%%-%ds" % self.length
+        self._rightformat = "%%%ds" % self.length
+
     def __str__(self):
-        return str(self.value)
+        return self.text(self.value)
 
     def __repr__(self):
         return str("<%s: %r>" % (self.name, self.value))
 
+    def text(self, value):
+        """Returns a human readable representation of value."""
+        return str(value)
+
     def get(self):
         """Returns the actual value associated with the field calling callables where needed."""
         return self._resolve(self.value)
 
     def set(self, value):
         """Validate data for Field and then set the Fields value to it."""
-        if self.is_valid(self.format(value)):
-            self.value = value
+        self.value = self.clean(value)
         return self.format(value)
 
+    def clean(self, value):
+        """Validate value and return what is to be stored for it."""
+        self.is_valid(self.format(value))
+        return value
+
     def formated(self):
         """Return a formatted version of the Field suitable for writing directly to the record datastream."""
         return self.format(self.value)
@@ -159,7 +260,7 @@ class Field(object):
 
     def format(self, value):
         """Formats the data according to the field's length, etc.  - meant to be overwirtten by subclasses."""
-        return ("%%-%ds" % self.length) % self._resolve(value)  # pad and left-adjust
+        return self._leftformat % self._resolve(value)  # pad and left-adjust
 
     def is_valid(self, value):
         """Returns true if value is valid date for Field else raises an Exception."""
@@ -175,15 +276,24 @@ class Field(object):
         """Do the actual parsing - meant to be overwirtten by subclasses."""
         return data.rstrip()
 
-    def parse(self, data):
-        """Check if the data can be parsed and then actually initiate parsing."""
+    def decode(self, data, validate=True):
+        """Check if the data can be parsed, parse it and return the validated value.
+
+        With validate=False data is trusted to fit the field, only parsing it might still fail."""
+        if not validate:
+            if data.strip() == '':
+                return self._resolve(self.default)
+            return self.get_parsed(data)
         if len(data) != self.length:
             raise SizeMismatch("%s has length %d but you trying to parse %r (len %d)" % (self.name,
                                 self.length, data, len(data)))
         if data.strip() == '':  # empty field
-            self.set(self._resolve(self.default))
-        else:
-            self.set(self.get_parsed(data))
+            return self.clean(self._resolve(self.default))
+        return self.clean(self.get_parsed(data))
+
+    def parse(self, data):
+        """Check if the data can be parsed and then actually initiate parsing."""
+        self.value = self.decode(data)
 
 
 class FixedField(Field):
@@ -197,11 +307,18 @@ class FixedField(Field):
             raise InvalidFieldDefinition('%r: default value %r does not corrospondent to field length (%d)' \
                                            % (self, self._resolve(self.default), self.length))
 
-    def set(self, value):
+    def decode(self, data, validate=True):
+        """Check data matches the default and return the default."""
+        if not validate:
+            return self.default
+        return super(FixedField, self).decode(data)
+
+    def clean(self, value):
         """Ensure FixedFields can't be changed after creation."""
         if str(value).strip() != str(self._resolve(self.default)).strip():
             raise FieldImmutable("tried to set %r to %r - but field is immutable."
                     % (str(self.__dict__), value))
+        return self.default
 
 
 class RightAdjustedField(Field):
@@ -209,7 +326,7 @@ class RightAdjustedField(Field):
 
     def format(self, value):
         """Formats the data according to the field's length, etc."""
-        return ("%%%ds" % self.length) % self._resolve(value)
+        return self._rightformat % self._resolve(value)
 
     def get_parsed(self, data):
         """Do the actual parsing."""
@@ -232,12 +349,29 @@ class EanField(Field):
             if not len(value) in [8, 13, 14]:
                 raise SizeMismatch("%s (EAN) has length 8, 13 or 14 but you trying to parse %r (len %d)" % (
                                     self.name, value, len(value)))
-            if checksumming.ean_digit(value[:-1]) != value[-1]:
+            if _checkdigits(value[:-1]) != value[-1]:
                 raise InvalidData("%s: %r no valid checkdigit (%s)" % (self.name, value,
-                                                                        checksumming.ean_digit(value[:-1])))
+                                                                        _checkdigits(value[:-1])))
         return super(EanField, self).is_valid(value)
 
 
+def validate_eans(values):
+    """Checks a whole column of EANs/ILNs and returns the invalid ones as (position, value) pairs.
+
+    Blank values are valid like in EanField. Every distinct value is checked only once."""
+    checked = {}
+    invalid = []
+    for position, value in enumerate(values):
+        valid = checked.get(value)
+        if valid is None:
+            ean = value.strip()
+            valid = checked[value] = (not ean or (len(ean) in (8, 13, 14) and ean.isdigit()
+                                                  and _checkdigits(ean[:-1]) == ean[-1]))
+        if not valid:
+            invalid.append((position, value))
+    return invalid
+
+
 class BooleanField(Field):
     """Boolean Field"""
 
@@ -258,12 +392,17 @@ class BooleanField(Field):
 class IntegerField(Field):
     """Right adjusted Integer Field."""
 
+    def _compile_formats(self):
+        """Build the format strings used by format() once instead of on every call."""
+        super(IntegerField, self)._compile_formats()
+        self._intformat = "%%%dd" % self.length
+
     def format(self, value):
         """Formats the data according to the field's length, etc."""
         if isinstance(value, int):
-            return ("%%%dd" % self.length) % self._resolve(value)
+            return self._intformat % value
         else:
-            return ("%%%ds" % self.length) % self._resolve(value)
+            return self._rightformat % self._resolve(value)
 
     def get_parsed(self, data):
         """Do the actual parsing."""
@@ -276,34 +415,62 @@ class IntegerField(Field):
 class IntegerFieldZeropadded(IntegerField):
     """Right adjusted zero padded Integer Field."""
 
-    def format(self, value):
-        """Formats the data according to the field's length, etc."""
-        if isinstance(value, int):
-            return ("%%0%dd" % self.length) % self._resolve(value)
-        else:
-            return ("%%%ds" % self.length) % self._resolve(value)
+    def _compile_formats(self):
+        """Build the format strings used by format() once instead of on every call."""
+        super(IntegerFieldZeropadded, self)._compile_formats()
+        self._intformat = "%%0%dd" % self.length
 
 
 class DecimalField(Field):
     """Field to encode an fixed precision integer.
 
     This takes an additional parameter to the parameters accepted by Field(), 'precision'.
-    'precision' defines the number of digits following the decimal point."""
+    'precision' defines the number of digits following the decimal point.
+
+    With 'scaled' set the field decodes into ints scaled by 10 ** precision (e.g. cents for precision=2)
+    instead of Decimals, ints are formated as such scaled values then."""
 
     def __init__(self, name, length=15, *args, **kwargs):
         self.precision = None
         if 'precision' in kwargs:
             self.precision = kwargs.pop('precision')
+        self.scaled = kwargs.pop('scaled', False)
+        if self.scaled and not self.precision:
+            raise InvalidFieldDefinition("%r: scaled needs a precision" % name)
         super(DecimalField, self).__init__(name, length, *args, **kwargs)
         if self.precision and (self.precision + 2 > self.length):
             raise InvalidFieldDefinition("%r: too much precision (%d) for too little length (%d)" %
                     (self, self.precision, self.length, ))
 
+    def _compile_formats(self):
+        """Build the format strings used by format() once instead of on every call."""
+        super(DecimalField, self)._compile_formats()
         # need a precision for the formatstring
-        precision = 0
-        if self.precision:
-            precision = self.precision
-        self.formatstring = "%%#%d.%df" % (self.length, precision)
+        self._digits = self.precision or 0
+        self._zeros = '0' * self._digits
+        self._blank = ' ' * self.length
+        self.formatstring = "%%#%d.%df" % (self.length, self._digits)
+        self._scaledformat = "%%0%dd" % (self._digits + 1)
+
+    def _split(self, value):
+        """Returns the integer part and the fractional digits (padded to precision) of value as strings.
+
+        This is exact for ints and Decimals which need no rounding, for everything else None is returned
+        and the value has to take the detour over float in formatstring."""
+        if isinstance(value, (int, long)):
+            if self.scaled:
+                digits = self._scaledformat % abs(value)
+                if value < 0:
+                    return '-' + digits[:-self._digits], digits[-self._digits:]
+                return digits[:-self._digits], digits[-self._digits:]
+            return '%d' % value, self._zeros
+        if isinstance(value, Decimal):
+            text = str(value)
+            if 'E' not in text:
+                intpart, dummy, frac = text.partition('.')
+                if len(frac) <= self._digits:
+                    return intpart, frac + self._zeros[len(frac):]
+        return None
 
     def _reducetofit(self, value):
         '''When converting a number which has length=self.length e.g. 9000000000.00000 w/ length=15 and precision=5 we get
@@ -325,23 +492,52 @@ class DecimalField(Field):
 
         value = self._resolve(value)
         if not value:
-            return "%*s" % (self.length, ' ')
-        ret = self.formatstring % Decimal(value)
+            return self._blank
+        parts = self._split(value)
+        if parts is None:
+            ret = self.formatstring % Decimal(value)
+        else:
+            ret = self._rightformat % ('%s.%s' % parts)
         ret = self._reducetofit(ret)
         return ret
 
-    def parse(self, data):
-        """Check if the data can be parsed and actually parse it."""
+    def decode(self, data, validate=True):
+        """Check if the data can be parsed and actually parse it.
+
+        Empty data results in the default value."""
 
         data = data.strip()
         dummy, frac = data, ''
-        if '.' in data and self.precision:
+        if validate and '.' in data and self.precision:
             dummy, frac = data.split('.')
             if len(frac) > self.precision:
                 raise InvalidData('Field %r has a precision of %d but %r has %d fractional digits' %
                                    (self, self.precision, data, len(frac)))
         if data:
-            self.set(Decimal(data.strip()))
+            if self.scaled:
+                intpart, dummy, frac = data.partition('.')
+                if len(frac) <= self.precision:
+                    digits = intpart + frac + self._zeros[len(frac):]
+                    if _is_integer(digits):
+                        return self._clean(int(digits), validate)
+                value = self._clean(Decimal(data), validate).scaleb(self.precision)
+                if value != value.to_integral_value():
+                    raise InvalidData('Field %r has a precision of %d but %r has more fractional digits' %
+                                       (self, self.precision, data))
+                return int(value)
+            return self._clean(Decimal(data), validate)
+        return self.default
+
+    def _clean(self, value, validate):
+        """Returns clean(value) if validate is set and value unchecked otherwise."""
+        if validate:
+            return self.clean(value)
+        return value
+
+    def parse(self, data):
+        """Check if the data can be parsed and actually parse it. Empty data leaves the value untouched."""
+        if data.strip():
+            self.value = self.decode(data)
 
 
 class DecimalFieldNoDot(DecimalField):
@@ -360,17 +556,39 @@ class DecimalFieldNoDot(DecimalField):
 
         if not self.precision:
             raise InvalidFieldDefinition("%r: no precision defined" % (self))
+        value = self._resolve(value)
+        if value:
+            parts = self._split(value)
+            if parts is not None:
+                ret = self._rightformat % ('%s%s' % parts)
+                if len(ret) != self.length:
+                    raise FieldTooLong("Field %r has maxlength of %d but you tried to write %r to it." % (
+                                        self, self.length, value))
+                return ret
+        # values needing rounding are handled by DecimalField
         ret = super(DecimalFieldNoDot, self).format(value).replace('.', '')
-        return ("%%%ds" % self.length) % ret.replace('.', '')
+        return self._rightformat % ret
 
-    def parse(self, data):
+    def decode(self, data, validate=True):
         """Check if the data can be parsed and actually parse it."""
 
+        if self.scaled and data[-self.precision:].isdigit() and _is_integer(data.lstrip()):
+            # the digits are the scaled value already
+            return self._clean(int(data), validate)
+
         # insert decimal point
         data = "%s.%s" % (data[:-(self.precision)], data[-(self.precision):])
 
         if data:
-            self.set(Decimal(data.strip()))
+            value = self._clean(Decimal(data.strip()), validate)
+            if self.scaled:
+                return int(value.scaleb(self.precision))
+            return value
+        return self.default
+
+    def parse(self, data):
+        """Check if the data can be parsed and actually parse it."""
+        self.value = self.decode(data)
 
 
 class DecimalFieldNoDotZeropadded(DecimalFieldNoDot):
@@ -390,62 +608,95 @@ class DecimalFieldNoDotSigned(DecimalFieldNoDotZeropadded):
     def format(self, value):
         """Formats the data according to the field's length, etc."""
 
+        if value and not callable(value):
+            parts = self._split(value)
+            if parts is not None:
+                digits = '%s%s' % parts
+                if digits[0] == '-':
+                    sign, digits = '-', digits[1:]
+                else:
+                    sign = '+'
+                if len(digits) < self.length:
+                    return digits.zfill(self.length - 1) + sign
         ret = super(DecimalFieldNoDotZeropadded, self).format(abs(value))
         # relace souporflous space at the beginning due to lenght also contianing the sign at the end
         # which the superclass doesn't know about
+        if ret[0] != ' ':
+            raise FieldTooLong("Field %r has maxlength of %d but you tried to write %r to it." % (
+                                self, self.length, value))
         ret = ret[1:].replace(' ', '0')
         if value < 0:
             return ret + '-'
         else:
             return ret + '+'
 
-    def parse(self, data):
+    def decode(self, data, validate=True):
         """Check if the data can be parsed and actually parse it."""
 
         # insert decimal point
         # print data, self.name, self.length
         sign = data[-1]
+        if (self.scaled and sign in ['+', '-', ' '] and data[-(self.precision + 1):-1].isdigit()
+            and _is_integer(data[:-1].lstrip())):
+            # the digits are the scaled value already
+            value = int(data[:-1])
+            if sign == '-':
+                value = -value
+            try:
+                return self._clean(value, validate)
+            except Exception, msg:
+                raise InvalidData("%s: %s" % (self.name, msg))
         data = "%s.%s" % (data[:-(self.precision + 1)], data[-(self.precision + 1):-1])
 
         if data:
             try:
                 if sign == '-':
-                    self.set(Decimal(data.strip()) * -1)
+                    value = self._clean(Decimal(data.strip()) * -1, validate)
                 elif sign in ['+', ' ']:
-                    self.set(Decimal(data.strip()))
+                    value = self._clean(Decimal(data.strip()), validate)
                 else:
                     raise InvalidData("%s: sign %r in %r is not allowed" % (self.name, sign, data))
             except Exception, msg:
                 raise InvalidData("%s: %s" % (self.name, msg))
+            if self.scaled:
+                return int(value.scaleb(self.precision))
+            return value
+        return self.default
 
 
 class DateField(Field):
     """Field encoding a date as YYYYMMDD.
 
     Default value should be a date dbject or an callable returning a date object.
+    Parsed dates are cached, at most 'cachesize' of them per format.
     """
 
     formatstr = '%Y%m%d'
+    cachesize = 1024
 
     def __init__(self, name, length=8, **kwargs):
         if length != 8:
             raise InvalidFieldDefinition("DateField defined with length != 8")
         super(DateField, self).__init__(name, length, **kwargs)
+        self._cache = _parse_caches.setdefault(self.formatstr, {})
+        self._layout = _date_layouts.get(self.formatstr)
 
-    def __str__(self):
-        if hasattr(self.value, 'strftime'):
-            return self.value.strftime('%Y-%m-%d')
-        return str(self.value)
+    def text(self, value):
+        """Returns a human readable representation of value."""
+        if hasattr(value, 'strftime'):
+            return value.strftime('%Y-%m-%d')
+        return str(value)
 
     def format(self, value):
         """Formats the data according to the field's length, etc."""
-        if hasattr(self._resolve(value), 'strftime'):
-            ret = self._resolve(value).strftime(self.__class__.formatstr)
+        value = self._resolve(value)
+        if hasattr(value, 'strftime'):
+            ret = value.strftime(self.formatstr)
         else:
-            ret = ("%%%ds" % self.length) % self._resolve(value)
+            ret = self._rightformat % value
         if len(ret) != self.length:
             raise FieldTooLong("Field %r has maxlength of %d but you tried to write %r to it" %
-                                (self, self.length, self._resolve(value)))
+                                (self, self.length, value))
         return ret
 
     def get_parsed(self, data):
@@ -454,10 +705,24 @@ class DateField(Field):
         if data in ['00000000', '99999999']:
             # This would result in an invalid date, return dummy date
             return self._resolve(self.default)
+        # a single lookup - another thread may clear the cache between 'in' and '[]'
+        value = self._cache.get(data)
+        if value is not None:
+            return value
         try:
-            return datetime.date(*time.strptime(data, self.__class__.formatstr)[0:3])
+            if self._layout and isinstance(data, str) and data.isdigit():
+                # for plain digits this is what time.strptime() would do - just a lot faster
+                year, month, day = self._layout
+                value = datetime.date(int(data[year:year + 4]), int(data[month:month + 2]),
+                                      int(data[day:day + 2]))
+            else:
+                value = datetime.date(*time.strptime(data, self.formatstr)[0:3])
         except ValueError, msg:
             raise InvalidData("%r - %s" % (data, msg))
+        if len(self._cache) >= self.cachesize:
+            self._cache.clear()
+        self._cache[data] = value
+        return value
 
 
 class DateFieldReverse(DateField):
@@ -466,47 +731,125 @@ class DateFieldReverse(DateField):
 
 
 class TimeField(Field):
-    """Field encoding time as HHMM."""
+    """Field encoding time as HHMM.
+
+    Parsed times are cached, at most 'cachesize' of them."""
+
+    cachesize = 1024
 
     def __init__(self, name, length=4, **kwargs):
         if length != 4:
             raise InvalidFieldDefinition("TimeField defined with length != 4 (%s)" % (length, ))
         super(TimeField, self).__init__(name, length, **kwargs)
+        self._cache = _parse_caches.setdefault('%H%M', {})
 
-    def __str__(self):
-        if hasattr(self.value, 'strftime'):
-            return self.value.strftime('%H:%M')
-        return str(self.value)
+    def text(self, value):
+        """Returns a human readable representation of value."""
+        if hasattr(value, 'strftime'):
+            return value.strftime('%H:%M')
+        return str(value)
 
     def format(self, value):
         """Formats the data according to the field's length, etc."""
-        if hasattr(self._resolve(value), 'strftime'):
-            ret = self._resolve(value).strftime('%H%M')
+        value = self._resolve(value)
+        if hasattr(value, 'strftime'):
+            ret = value.strftime('%H%M')
         else:
-            ret = ("%%%ds" % self.length) % self._resolve(value)
+            ret = self._rightformat % value
         if len(ret) != self.length:
             raise FieldTooLong("Field %r has maxlength of %d but you tried to write %r to it." % (
-                                self, self.length, self._resolve(value)))
+                                self, self.length, value))
         return ret
 
     def get_parsed(self, data):
         """Do the actual parsing."""
+        # a single lookup - another thread may clear the cache between 'in' and '[]'
+        value = self._cache.get(data)
+        if value is not None:
+            return value
         try:
-            return datetime.datetime(*time.strptime(data, "%H%M")[0:6]).time()
+            if isinstance(data, str) and data.isdigit():
+                value = datetime.time(int(data[:2]), int(data[2:]))
+            else:
+                value = datetime.datetime(*time.strptime(data, "%H%M")[0:6]).time()
         except ValueError, msg:
             raise InvalidData("%r - %s" % (data, msg))
+        if len(self._cache) >= self.cachesize:
+            self._cache.clear()
+        self._cache[data] = value
+        return value
+
+
+class BoundField(object):
+    """A Field together with the value it has in a certain record.
+
+    This is what name+'_field' attributes of records return. It offers the same interface as a Field
+    used on it's own but reads and writes the value vector of the record."""
+
+    def __init__(self, record, index, field):
+        self.record = record
+        self.index = index
+        self.field = field
+
+    def __getattr__(self, name):
+        # length, choices, precision, doc, etc. come from the shared Field
+        return getattr(self.field, name)
+
+    def __str__(self):
+        return self.field.text(self.value)
+
+    def __repr__(self):
+        return str("<%s: %r>" % (self.field.name, self.value))
+
+    def _get_value(self):
+        value = self.record._values[self.index]
+        if value is _PENDING:
+            return self.record._decode_field(self.index)
+        return value
+
+    def _set_value(self, value):
+        self.record._values[self.index] = value
+
+    value = property(_get_value, _set_value)
+
+    def get(self):
+        """Returns the actual value associated with the field calling callables where needed."""
+        return self.field._resolve(self.value)
+
+    def set(self, value):
+        """Validate data for Field and then set the Fields value to it."""
+        self.value = self.field.clean(value)
+        return self.field.format(value)
+
+    def formated(self):
+        """Return a formatted version of the Field suitable for writing directly to the record datastream."""
+        return self.field.format(self.value)
+
+    def parse(self, data):
+        """Parse data and store the result in the record."""
+        self.value = self.field.decode(data)
 
 
 class _FieldDescriptorClass(object):
     """Routes arround descriptors for name+'_field' attributes in generate_field_datensatz_class()."""
 
-    def __init__(self, fieldinstance):
-        self.fieldinstance = fieldinstance
+    def __init__(self, index, field):
+        self.index = index
+        self.field = field
 
     # methods used for the descriptor protocol. See http://docs.python.org/ref/descriptors.html
 
     def __get__(self, obj, objtype):
-        return self.fieldinstance
+        if obj is None:
+            return self.field
+        return BoundField(obj, self.index, self.field)
+
+
+def _is_integer(text):
+    """Returns True if text is an optional sign followed by digits - unlike int() no whitespace inbetween."""
+    if text[:1] in ('+', '-'):
+        return text[1:].isdigit()
+    return text.isdigit()
 
 
 def _get_length(felder):
@@ -529,85 +872,873 @@ def _get_length(felder):
     return len(posarray)
 
 
+class RecordSchema(object):
+    """Compiled layout of a record class, built once by generate_field_datensatz_class().
+
+    'fields' is an immutable tuple of (startpos, endpos, field) entries ordered by startpos. The field
+    instances in there are shared by all records of the class and act as stateless codecs, the values
+    of a record are kept in a list ordered the same way. 'defaults' is the initial content of that list
+    and 'index' maps field names to positions in it.
+
+    'splitter' is a struct.Struct cutting a whole record into the data of its fields - skipping the
+    gaps between them - in a single call. 'decoders' and 'formatters' are the decode() and format()
+    methods of the fields, which use format strings compiled when the fields were created.
+
+    'template' is a bytearray of the whole record with the gaps filled with spaces and the FixedFields
+    already formated into it. 'variable' lists (startpos, endpos, index, field, format) for all other
+    fields, which is all serializing has to write into a copy of the template.
+    """
+
+    def __init__(self, entries, length):
+        self.length = length
+        self.fields = tuple(sorted(entries, key=lambda x: x[0]))
+        self.names = tuple([field.name for dummy, dummy, field in self.fields])
+        self.defaults = tuple([field.default for dummy, dummy, field in self.fields])
+        self.index = dict([(name, i) for i, name in enumerate(self.names)])
+        self.decoders = tuple([field.decode for dummy, dummy, field in self.fields])
+        self.formatters = tuple([field.format for dummy, dummy, field in self.fields])
+        self.splitter = struct.Struct(_get_structformat(self.fields, length))
+        self.template = bytearray(' ' * length)
+        variable = []
+        for index, (startpos, endpos, field) in enumerate(self.fields):
+            if isinstance(field, FixedField) and not callable(field.default):
+                self.template[startpos:endpos] = field.format(field.default)
+            else:
+                variable.append((startpos, endpos, index, field, field.format))
+        self.variable = tuple(variable)
+
+    def split(self, data):
+        """Cut data into a sequence of chunks, one for each field."""
+        if isinstance(data, str):
+            return self.splitter.unpack(data)
+        # unicode and other sequences not supported by struct
+        return [data[startpos:endpos] for startpos, endpos, dummy in self.fields]
+
+    def subset(self, names):
+        """Returns a RecordSchema for the same kind of record containing only the fields given in names."""
+        for name in names:
+            if name not in self.index:
+                raise InvalidFieldDefinition("%r: unknown field %r" % (self, name))
+        return RecordSchema([entry for entry in self.fields if entry[2].name in names], self.length)
+
+    def __repr__(self):
+        return "<RecordSchema: %d fields, %d bytes>" % (len(self.fields), self.length)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __iter__(self):
+        return iter(self.fields)
+
+
+def _get_structformat(fields, length):
+    """Returns a struct format string extracting the given fields from a record of the given length."""
+    fmt = ['=']
+    pos = 0
+    for startpos, endpos, dummy in fields:
+        if startpos > pos:
+            fmt.append('%dx' % (startpos - pos))
+        fmt.append('%ds' % (endpos - startpos))
+        pos = endpos
+    if length > pos:
+        fmt.append('%dx' % (length - pos))
+    return ''.join(fmt)
+
+
+def _fieldgen(name=None, length=None, startpos=None, endpos=None, fieldclass=Field, **kwargs):
+    """Generate a Field instance from a single field description."""
+    return fieldclass(name, length, **kwargs)
+
+
+def _show_value(field, value, raw):
+    """Returns the representation of a field used by DatensatzBaseClass.__repr__() and pretty()."""
+    if raw is None:
+        return "<%s: %r>" % (field.name, value)
+    return "<%s: invalid %r>" % (field.name, raw)
+
+
 class DatensatzBaseClass(object):
-    """This is the base which will be sublassed for Records - collection of Fields."""
+    """This is the base which will be sublassed for Records - collection of Fields.
+
+    A record instance only holds a list with the values of its fields and - after parsing lazily - the
+    raw data. Everything else is shared by all instances of a class via its RecordSchema."""
+    __slots__ = ('_values', '_raw')
     length = None
+    schema = None
+    # source of the generated parse() and serialize() of compiled classes
+    _source = None
 
     def __init__(self):
-        self.fielddict = {}
-        for feld in self.feldsource:
-            self._feldgen(**feld)
+        self._values = list(self.schema.defaults)
+        self._raw = None
+
+    def reset(self):
+        """Set all fields back to their default values, e.g. to reuse the record for building a new one.
+
+        parse() replaces all values anyway, so records reused for parsing need no reset()."""
+        self._values = list(self.schema.defaults)
+        self._raw = None
+
+    def _decode_field(self, index):
+        """Decode the value of a field after a lazy parse() and store it in the value list."""
+        startpos, endpos, field = self.schema.fields[index]
+        value = self._values[index] = field.decode(self._raw[startpos:endpos])
+        return value
+
+    def validate_all(self):
+        """Decode all fields not accessed since a lazy parse(), raising the first validation error."""
+        if self._raw is not None:
+            values = self._values
+            for index in range(len(values)):
+                if values[index] is _PENDING:
+                    self._decode_field(index)
+            self._raw = None
+
+    def _shown_values(self):
+        """Returns (field, value, raw) for all fields, raw being the data of fields a lazy parse() left
+        pending which can't be decoded and None otherwise.
+
+        Nothing is stored or raised - repr() is needed most for logging and tracebacks of invalid data."""
+        ret = []
+        for index, (startpos, endpos, field) in enumerate(self.schema.fields):
+            value = self._values[index]
+            if value is _PENDING:
+                try:
+                    value = field.decode(self._raw[startpos:endpos])
+                except Exception:
+                    ret.append((field, None, self._raw[startpos:endpos]))
+                    continue
+            ret.append((field, value, None))
+        return ret
 
     def __repr__(self):
-        return "<%s: %s>" % (self.__name__, ', '.join([repr(x) for x in self.fielddict.values()]))
+        return "<%s: %s>" % (self.__name__, ', '.join([_show_value(field, value, raw)
+                                                       for field, value, raw in self._shown_values()]))
 
     def pretty(self):
         """Returns a nicely formated string representation suitable for debugging"""
-        return "<%s: %s>" % (self.__name__,
-                             ', '.join([repr(x) for x in self.fielddict.values() if str(x).strip()]))
-
-    def _feldgen(self, name=None, length=None, startpos=None, endpos=None, fieldclass=Field, **kwargs):
-        """Generate field descriptor for a single field and validate Field description."""
-        fieldinstance = fieldclass(name, length, **kwargs)
-        setattr(self, name + '_field', fieldinstance)
-        self.fielddict[startpos] = fieldinstance
+        shown = [_show_value(field, value, raw) for field, value, raw in self._shown_values()
+                 if (raw or field.text(value)).strip()]
+        return "<%s: %s>" % (self.__name__, ', '.join(shown))
 
     def fields(self):
         """Equivalent of vars() but beeing able to handle descriptor accessed fields."""
-        return dict([(x.name, x.get()) for x in self.fielddict.values()])
+        return self.as_dict()
 
     def serialize(self):
         """Return a string representation of the Datensatz (Record)."""
-        data = [' '] * self.length
-        for startpos, field in sorted(self.fielddict.items()):
+        self.validate_all()
+        # only the non constant fields are written to a copy of the template
+        data = self.schema.template[:]
+        values = self._values
+        for startpos, endpos, index, field, format in self.schema.variable:
             try:
-                fielddata = field.formated()
+                fielddata = format(values[index])
             except Exception, e:
                 raise ValueError("Error serializing %r: %s" % (field, str(e)))
-            data[startpos:startpos + field.length] = list(fielddata)
-        return ''.join(data)
+            if isinstance(fielddata, unicode):
+                return self._serialize_unicode()
+            data[startpos:endpos] = fielddata
+        return str(data)
 
-    def parse(self, data):
-        """Initiate parsing for all fields."""
+    def _serialize_unicode(self):
+        """Serialize records containing unicode values, which can't be written to a bytearray."""
+        data = [' '] * self.length
+        for (startpos, endpos, field), format, value in zip(self.schema.fields, self.schema.formatters,
+                                                            self._values):
+            data[startpos:endpos] = list(format(value))
+        return u''.join(data)
+
+    @classmethod
+    def projection(cls, names):
+        """Returns a record class parsing the same data as this class but only the fields given in names.
+
+        All other fields are skipped when parsing and not available as attributes."""
+        key = tuple(sorted(names))
+        if key not in cls._projections:
+            felder = [feld for feld in cls.feldsource if feld['name'] in key]
+            projected = _generate_class(cls.__name__, felder, cls.schema.subset(key), cls.__doc__,
+                                        cls._source is not None)
+            projected.__module__ = cls.__module__
+            projected._qualname = cls._qualname
+            projected._projected = key
+            projected._scaled = cls._scaled
+            cls._projections[key] = projected
+        return cls._projections[key]
+
+    @classmethod
+    def scaled(cls, names=None):
+        """Returns a record class parsing the same data as this class but with the DecimalFields given in
+        names (all DecimalFields with a precision if None) decoding into scaled ints, see DecimalField."""
+        decimals = [field.name for dummy, dummy, field in cls.schema.fields
+                    if isinstance(field, DecimalField) and field.precision]
+        if names is None:
+            names = decimals
+        for name in names:
+            if name not in decimals:
+                raise InvalidFieldDefinition("%r: %r is no DecimalField with precision" % (cls, name))
+        key = tuple(sorted(set(names) | set(cls._scaled or ())))
+        if key not in cls._scaledclasses:
+            felder = [dict(feld, scaled=True) if feld['name'] in key else feld for feld in cls.feldsource]
+            variant = _generate_class(cls.__name__, felder, _build_schema(felder, cls.length), cls.__doc__,
+                                      cls._source is not None)
+            variant.__module__ = cls.__module__
+            variant._qualname = cls._qualname
+            variant._projected = cls._projected
+            variant._scaled = key
+            cls._scaledclasses[key] = variant
+        return cls._scaledclasses[key]
+
+    def __reduce__(self):
+        """Pickle records by the qualified name of their class and their values or - if parsed lazily and
+        not yet fully decoded - their raw data together with the values decoded or set since."""
+        if self._raw is not None:
+            decoded = [(index, value) for index, value in enumerate(self._values) if value is not _PENDING]
+            return (_restore_record, (self._qualname, self._projected, None, self._raw, self._scaled,
+                                      decoded))
+        return (_restore_record, (self._qualname, self._projected, self._values, None, self._scaled))
+
+    @classmethod
+    def from_data(cls, data, lazy=False, validate=True):
+        """Returns a new record with data parsed into it, see parse().
+
+        This skips filling the new record with the default values first."""
+        record = cls.__new__(cls)
+        record.parse(data, lazy, validate)
+        return record
+
+    @classmethod
+    def parse_into(cls, data, target, lazy=False, validate=True):
+        """Parses data into the existing record target and returns it, see parse().
+
+        Tight loops can reuse one record per class this way instead of creating a new one per line. Only
+        the value list is replaced, so values read from target before stay valid."""
+        if not isinstance(target, cls):
+            raise TypeError("%r can't parse into %r" % (cls, target))
+        target.parse(data, lazy, validate)
+        return target
+
+    @classmethod
+    def patch(cls, buf, name, value, offset=0):
+        """Overwrite the field name of the serialized record starting at offset in buf with value.
+
+        buf is a bytearray or a writable mmap, e.g. of a file to be retransmitted with a new reference.
+        value is validated and formated like when setting the attribute and serializing a record, but
+        only the bytes of this one field are written - the rest of the record is neither parsed nor
+        checked. Returns the data written."""
+        index = cls.schema.index.get(name)
+        if index is None:
+            raise InvalidFieldDefinition("%r: unknown field %r" % (cls, name))
+        startpos, endpos, field = cls.schema.fields[index]
+        if offset < 0 or offset + cls.length > len(buf):
+            raise SizeMismatch("no record of %d bytes at offset %d in %d bytes" % (cls.length, offset,
+                                                                                  len(buf)))
+        fielddata = field.format(field.clean(value))
+        if len(fielddata) != endpos - startpos:
+            raise SizeMismatch("%s: %r doesn't fit in %d bytes" % (name, fielddata, endpos - startpos))
+        buf[offset + startpos:offset + endpos] = fielddata
+        return fielddata
+
+    @classmethod
+    def from_values(cls, values):
+        """Returns a new record holding values, which are ordered like schema.fields and not validated.
+
+        This is the counterpart of reading the value list of a record, e.g. to move records between
+        processes."""
+        record = cls.__new__(cls)
+        record._values = list(values)
+        record._raw = None
+        return record
+
+    def parse(self, data, lazy=False, validate=True):
+        """Initiate parsing for all fields.
+
+        With lazy=True only the length of data is checked. Fields are decoded and validated the first
+        time they are accessed, use validate_all() to force this for all of them.
+
+        validate=False is meant for trusted input, e.g. files written by our own systems: The fields only
+        parse their data, the checks done when setting values - length, choices, EAN check digits, values
+        of FixedFields - are skipped. This has no effect on lazy parsing."""
         if len(data) != self.length:
             raise SizeMismatch("tried to parse %d bytes with %r - which excepts %d bytes." % (
-                                len(data), self, self.length))
+                                len(data), self.__name__, self.length))
+        if lazy:
+            self._values = [_PENDING] * len(self.schema.fields)
+            self._raw = data
+            return
         # cut data in chunks fitting to our fields and the the fields parse them
-        for startpos, field in sorted(self.fielddict.items()):
-            field.parse(data[startpos:startpos + field.length])
+        if validate:
+            self._values = [decode(chunk) for decode, chunk in zip(self.schema.decoders,
+                                                                   self.schema.split(data))]
+        else:
+            self._values = [decode(chunk, False) for decode, chunk in zip(self.schema.decoders,
+                                                                          self.schema.split(data))]
+        self._raw = None
 
     def as_dict(self):
+        self.validate_all()
         d = {}
-        for startpos, field in sorted(self.fielddict.items()):
-            d[field.name] = field.get()
+        for (dummy, dummy, field), value in zip(self.schema.fields, self._values):
+            d[field.name] = field._resolve(value)
         return d
 
 
-def generate_field_datensatz_class(felder, name=None, length=None, doc=None):
-    """Dynamicaly generate a class based on field description."""
-    # keep in mind, that we are operating on a class, not on an instance.
+def _build_schema(felder, length):
+    """Generate the fields described in felder and return their RecordSchema."""
+    return RecordSchema([(feld['startpos'], feld['endpos'], _fieldgen(**feld)) for feld in felder], length)
+
+
+def _remembering(decode, cachesize=1024):
+    """Returns a function decoding data like decode, which remembers up to cachesize decoded values."""
+    cache = {}
+
+    def remember(data):
+        # a single lookup - another thread may clear the cache between 'in' and '[]'
+        value = cache.get(data)
+        if value is not None:
+            return value
+        if len(cache) >= cachesize:
+            cache.clear()
+        value = cache[data] = decode(data)
+        return value
+    return remember
+
+
+def _get_decoder_source(index, field, namespace):
+    """Returns an expression decoding the data in variable c<index> for field, adding the objects it uses
+    to namespace.
+
+    The expression must fail for all data field.decode() fails for - generated code then falls back to
+    the generic implementation - but may also fail in other cases."""
+    default = field.default
+    fieldtype = type(field)
+    if not field.choices and not callable(default):
+        if fieldtype is FixedField:
+            namespace['_default%d' % index] = default
+            namespace['_fixed%d' % index] = (str(default).strip(), '')
+            return '_default%d if c%d.strip() in _fixed%d else _decode%d(c%d)' % (index, index, index, index,
+                                                                                    index)
+        try:
+            field.clean(default)
+        except Exception:
+            pass
+        else:
+            namespace['_default%d' % index] = default
+            if fieldtype is Field:
+                return 'c%d.rstrip() or _default%d' % (index, index)
+            if fieldtype is RightAdjustedField:
+                return 'c%d.lstrip() or _default%d' % (index, index)
+            if fieldtype in (IntegerField, IntegerFieldZeropadded):
+                return 'int(c%d) if c%d.strip() else _default%d' % (index, index, index)
+    if isinstance(field, DecimalField) and not callable(default):
+        # creating Decimals is expensive, but most amounts in a file - like zero - recur
+        namespace['_decode%d' % index] = _remembering(field.decode)
+    return '_decode%d(c%d)' % (index, index)
+
+
+def _compile_methods(name, schema):
+    """Generate and compile parse() and serialize() for the records described by schema.
+
+    The generated functions handle the fields one by one in straight-line code instead of looping over
+    them. Cases they don't cover - lazy parsing, validate=False, unicode, errors - are passed on to the
+    generic implementation in DatensatzBaseClass. Returns the source and a dict with the functions."""
+    length = schema.length
+    namespace = dict(_parse=DatensatzBaseClass.parse, _serialize=DatensatzBaseClass.serialize,
+                     _unpack=schema.splitter.unpack)
+    lines = ['def parse(self, data, lazy=False, validate=True):',
+             '    if lazy or not validate or type(data) is not str or len(data) != %d:' % length,
+             '        return _parse(self, data, lazy, validate)',
+             '    try:']
+    chunks = ['c%d' % index for index in range(len(schema.fields))]
+    for start in range(0, len(chunks), 10):
+        lines.append('        %s%s,%s' % ('(' if start == 0 else ' ', ', '.join(chunks[start:start + 10]),
+                                          '' if start + 10 < len(chunks) else ') = _unpack(data)'))
+    lines.append('        self._values = [')
+    for index, (startpos, endpos, field) in enumerate(schema.fields):
+        namespace.setdefault('_decode%d' % index, field.decode)
+        lines.append('            %s,  # %r %d:%d' % (_get_decoder_source(index, field, namespace),
+                                                     field.name, startpos, endpos))
+    lines.extend(['        ]',
+                  '    except Exception:',
+                  '        # the generic implementation raises the appropriate exception',
+                  '        return _parse(self, data, lazy, validate)',
+                  '    self._raw = None',
+                  '',
+                  '',
+                  'def serialize(self):',
+                  '    if self._raw is not None:',
+                  '        self.validate_all()',
+                  '    values = self._values',
+                  '    try:',
+                  '        data = "".join(['])
+    pos = 0
+    for startpos, endpos, index, field, format in schema.variable:
+        if startpos > pos:
+            lines.append('            %r,' % str(schema.template[pos:startpos]))
+        namespace['_format%d' % index] = format
+        lines.append('            _format%d(values[%d]),  # %r %d:%d' % (index, index, field.name, startpos,
+                                                                        endpos))
+        pos = endpos
+    if length > pos:
+        lines.append('            %r,' % str(schema.template[pos:length]))
+    lines.extend(['        ])',
+                  '    except Exception:',
+                  '        return _serialize(self)',
+                  '    if type(data) is not str or len(data) != %d:' % length,
+                  '        # unicode values or values not fitting their fields',
+                  '        return _serialize(self)',
+                  '    return data',
+                  ''])
+    source = '\n'.join(lines)
+    exec compile(source, '<generated %s>' % name, 'exec') in namespace
+    return source, dict(parse=namespace['parse'], serialize=namespace['serialize'])
+
+
+def _generate_class(name, felder, schema, doc, compiled=False):
+    """Generate a record class with field descriptors for the fields in schema.
+
+    With compiled=True parse() and serialize() are replaced by functions generated for schema."""
+    attributes = {'__name__': name, '__doc__': doc, '__slots__': ()}
+    if compiled:
+        source, methods = _compile_methods(name, schema)
+        attributes.update(methods)
+        attributes['_source'] = source
+    klass = type(name, (DatensatzBaseClass, ), attributes)
+    klass.feldsource = felder
+    klass.length = schema.length
+    klass.schema = schema
+    klass._projections = {}
+    klass._qualname = None
+    klass._projected = None
+    klass._scaled = None
+    klass._scaledclasses = {}
+    # add descriptors
+    for index, (dummy, dummy, field) in enumerate(schema.fields):
+        setattr(klass, field.name, FieldDescriptor(field.name, index, field))
+        setattr(klass, field.name + '_field', _FieldDescriptorClass(index, field))
+    return klass
+
 
-    def klass_feldgen(klass, name=None, length=None, startpos=None, endpos=None, fieldclass=Field, **kwargs):
-        """Generate field descriptor for a single field and validate Field description."""
-        setattr(klass, name, FieldDescriptor(name, length, **kwargs))
+def _register_class(klass, module):
+    """Register a generated class under a name qualified by the module defining it and its layout.
+
+    Classes with the same name but a different layout in the same module get different names, which
+    don't depend on the order a process generates them in. Compiled and generic classes differ, too.
+    Generating a class with the same name and layout again - e.g. when reloading the module - replaces
+    the registered one, so classes for different record types need different names."""
+    layout = repr((klass.length, klass._source is not None,
+                   [(startpos, endpos, field.name, type(field).__name__)
+                    for startpos, endpos, field in klass.schema.fields]))
+    qualname = '%s.%s#%s' % (module, klass.__name__, hashlib.md5(layout).hexdigest()[:12])
+    klass.__module__ = module
+    klass._qualname = qualname
+    _record_classes[qualname] = klass
+
+
+def _restore_record(qualname, projected, values, raw, scaled=None, decoded=()):
+    """Recreate a record pickled by DatensatzBaseClass.__reduce__().
+
+    decoded lists (index, value) for the fields of a lazily parsed record which are already decoded or
+    have been changed."""
+    if qualname not in _record_classes:
+        # the unpickling process might not have imported the module defining the class yet
+        __import__(qualname.rsplit('.', 1)[0])
+    if qualname not in _record_classes:
+        raise InvalidFieldDefinition("Unbekannte Datensatzklasse %s" % qualname)
+    klass = _record_classes[qualname]
+    if scaled is not None:
+        klass = klass.scaled(scaled)
+    if projected is not None:
+        klass = klass.projection(projected)
+    if raw is not None:
+        record = klass.from_data(raw, lazy=True)
+        for index, value in decoded:
+            record._values[index] = value
+        return record
+    return klass.from_values(values)
+
+
+def generate_field_datensatz_class(felder, name=None, length=None, doc=None, module=None, compiled=False):
+    """Dynamicaly generate a class based on field description.
+
+    Instances of the class can be pickled as long as the module defining the class (the calling module
+    if module is not given) generates it again on import.
+
+    With compiled=True the class gets parse() and serialize() methods generated as Python source for
+    this layout, handling field after field without looping. The source is kept in klass._source for
+    debugging."""
+    # keep in mind, that we are operating on a class, not on an instance.
+    if module is None:
+        module = sys._getframe(1).f_globals.get('__name__', '__main__')
 
     if not name:
         name = 'AnonymousDatensatzBase'
 
-    klass = type(name, (DatensatzBaseClass, ), {'__name__': name, '__doc__': doc})
-    klass.feldsource = felder
     reallength = _get_length(felder)
-    klass.length = length or reallength
-    if klass.length < reallength:
+    length = length or reallength
+    if length < reallength:
         raise InvalidFieldDefinition(
               "Gesamtlänge der Felder überschreitet die definierte Länge für den Datensatz %d|%d" % (
-              klass.length, reallength))
-    # add descriptors
-    for feld in klass.feldsource:
-        klass_feldgen(klass, **feld)
+              length, reallength))
+    klass = _generate_class(name, felder, _build_schema(felder, length), doc, compiled)
+    _register_class(klass, module)
     return klass
 
 
+def parse_columns(klass, lines, names=None):
+    """Parse many records of the same type into columns instead of record instances.
+
+    klass is a class generated by generate_field_datensatz_class(), lines an iterable of records
+    suitable for klass.parse(). If names is given only these fields are cut out and decoded.
+    Returns a dict mapping each field name to a list of values in the order of lines.
+
+    >>> felder = [dict(length=4,  startpos=0,  endpos=4,  name='position'),
+    ...           dict(length=6,  startpos=4,  endpos=10, name='menge', fieldclass=IntegerField)]
+    >>> klass = generate_field_datensatz_class(felder, name='test13', length=10)
+    >>> parse_columns(klass, ['0001    17', '0002     4'], names=['menge'])
+    {'menge': [17, 4]}
+    """
+    schema = klass.schema
+    if names is not None:
+        schema = schema.subset(names)
+    columns = [[] for dummy in schema.fields]
+    appenders = [column.append for column in columns]
+    decoders = schema.decoders
+    length = schema.length
+    for line in lines:
+        if len(line) != length:
+            raise SizeMismatch("tried to parse %d bytes with %r - which excepts %d bytes." % (
+                                len(line), klass.__name__, length))
+        for append, decode, chunk in zip(appenders, decoders, schema.split(line)):
+            append(decode(chunk))
+    return dict(zip(schema.names, columns))
+
+
+def columns_as_arrays(columns):
+    """Convert the columns returned by parse_columns() to arrays.
+
+    If NumPy is installed every column is converted to a numpy.ndarray, otherwise columns
+    containing only integers or floats are converted to an array.array. All other columns
+    are returned unchanged as lists."""
+    ret = {}
+    for name, values in columns.items():
+        if numpy is not None:
+            ret[name] = numpy.array(values)
+        elif values and all([isinstance(x, (int, long)) and not isinstance(x, bool) for x in values]):
+            try:
+                ret[name] = array.array('l', values)
+            except OverflowError:
+                ret[name] = values
+        elif values and all([isinstance(x, float) for x in values]):
+            ret[name] = array.array('d', values)
+        else:
+            ret[name] = values
+    return ret
+
+
+def _require_numpy():
+    """Raise ImportError if NumPy is not installed."""
+    if numpy is None:
+        raise ImportError("NumPy is needed for this functionality but could not be imported")
+
+
+def numpy_dtype(klass, prefix=0):
+    """Returns a NumPy structured dtype describing records of klass.
+
+    Every field becomes a fixed size byte string (S<length>) at its position in the record. 'prefix' is the
+    number of bytes preceding the record, e.g. a line header which is not part of the record.
+    """
+    _require_numpy()
+    schema = klass.schema
+    return numpy.dtype(dict(names=list(schema.names),
+                            formats=['S%d' % field.length for dummy, dummy, field in schema.fields],
+                            offsets=[prefix + startpos for startpos, dummy, dummy in schema.fields],
+                            itemsize=prefix + schema.length))
+
+
+def numpy_records(klass, data, prefix=0, linesep=1):
+    """Returns a NumPy record array viewing data (a string, buffer or mmap) without copying it.
+
+    data has to consist of rows of prefix bytes, a record of klass and linesep bytes of line terminator.
+    The terminator of the last row may be missing."""
+    dtype = numpy_dtype(klass, prefix)
+    rowsize = dtype.itemsize + linesep
+    count = (len(data) + linesep) // rowsize
+    if count * rowsize not in (len(data), len(data) + linesep):
+        raise SizeMismatch("%d bytes of data are not a multiple of the row size %d of %s" % (
+                            len(data), rowsize, klass.__name__))
+    return numpy.ndarray(shape=(count, ), dtype=dtype, buffer=data, strides=(rowsize, ))
+
+
+def numpy_memmap(klass, filename, prefix=0, linesep=1):
+    """Memory map the file filename as read only NumPy record array, see numpy_records()."""
+    _require_numpy()
+    if not os.path.getsize(filename):
+        return numpy.zeros(0, dtype=numpy_dtype(klass, prefix))
+    return numpy_records(klass, numpy.memmap(filename, dtype=numpy.uint8, mode='r'), prefix, linesep)
+
+
+def _numpy_int(data, name):
+    """Convert an array of byte strings to int64, empty strings are converted to 0."""
+    data = numpy.char.strip(data)
+    data = numpy.where(data == '', '0', data)
+    try:
+        return data.astype(numpy.int64)
+    except ValueError, msg:
+        raise InvalidData("%s: %s" % (name, msg))
+
+
+def numpy_column(klass, records, name, scaled=False):
+    """Vectorized conversion of the column name of records returned by numpy_records() or numpy_memmap().
+
+    Supported are IntegerField columns (returned as int64), DecimalFieldNoDot and DecimalFieldNoDotSigned
+    (float64 or - if scaled is True - int64 in units of the last decimal place) and DateField columns
+    (datetime64[D], empty, 00000000 and 99999999 are returned as NaT)."""
+    _require_numpy()
+    field = klass.schema.fields[klass.schema.index[name]][2]
+    data = records[name]
+    if isinstance(field, DateField):
+        invalid = (numpy.char.strip(data) == '') | (data == '00000000') | (data == '99999999')
+        ints = _numpy_int(numpy.where(invalid, '19700101', data), name)
+        if isinstance(field, DateFieldReverse):
+            year, month, day = ints % 10000, (ints // 10000) % 100, ints // 1000000
+        else:
+            year, month, day = ints // 10000, (ints // 100) % 100, ints % 100
+        if ((month < 1) | (month > 12) | (day < 1) | (day > 31)).any():
+            raise InvalidData("%s: column contains invalid dates" % name)
+        dates = (year - 1970).astype('datetime64[Y]').astype('datetime64[M]')
+        dates = (dates + (month - 1).astype('timedelta64[M]')).astype('datetime64[D]')
+        dates = dates + (day - 1).astype('timedelta64[D]')
+        # days past the end of the month, e.g. 20100230, roll over into the next month
+        months = dates.astype('datetime64[M]')
+        if (((months.astype(numpy.int64) % 12 + 1) != month)
+                | ((dates - months).astype(numpy.int64) + 1 != day)).any():
+            raise InvalidData("%s: column contains invalid dates" % name)
+        dates[invalid] = numpy.datetime64('NaT')
+        return dates
+    elif isinstance(field, DecimalFieldNoDotSigned):
+        ints = _numpy_int(data.astype('S%d' % (field.length - 1)), name)
+        # the last byte of each value, taken as number since numpy ignores trailing spaces in comparisons
+        signs = numpy.ascontiguousarray(data).view(numpy.uint8).reshape(-1, field.length)[:, -1]
+        if ((signs != ord('+')) & (signs != ord('-')) & (signs != ord(' '))).any():
+            raise InvalidData("%s: column contains signs other than '+', '-' and ' '" % name)
+        ints = numpy.where(signs == ord('-'), -ints, ints)
+    elif isinstance(field, DecimalFieldNoDot):
+        ints = _numpy_int(data, name)
+    elif isinstance(field, IntegerField):
+        return _numpy_int(data, name)
+    else:
+        raise InvalidFieldDefinition("%s: no vectorized conversion for %s" % (name, field.__class__.__name__))
+    if scaled:
+        return ints
+    return ints / float(10 ** field.precision)
+
+
+def iter_offsets(data, startpos=0, endpos=None):
+    """Yield (startpos, endpos) of every line in data (a string or mmap) without the newline.
+
+    Nothing is copied, the lines are data[startpos:endpos]. A trailing newline does not result in an
+    additional empty line."""
+    if endpos is None:
+        endpos = len(data)
+    find = data.find
+    pos = startpos
+    while pos < endpos:
+        newline = find('\n', pos, endpos)
+        if newline < 0:
+            yield pos, endpos
+            return
+        yield pos, newline
+        pos = newline + 1
+
+
+def iter_lines(data):
+    """Yield the lines of data (a string or mmap) one by one instead of splitting it all at once.
+
+    If data is neither a string nor a mmap it is expected to be an iterable of lines already (e.g. a
+    file object or the result of mmap_lines()) and passed through.
+
+    >>> list(iter_lines('abc\\ndef\\n'))
+    ['abc', 'def']
+    """
+    if not isinstance(data, (basestring, mmap.mmap)):
+        for line in data:
+            yield line
+        return
+    for startpos, endpos in iter_offsets(data):
+        yield data[startpos:endpos]
+
+
+def mmap_lines(filename):
+    """Yield the lines of the file filename, reading it via mmap.
+
+    Only the current line is copied to a string, so memory usage does not depend on the size of the file.
+    The lines can be fed directly to the various parse functions of edilib."""
+    fileobj = open(filename, 'rb')
+    try:
+        if not os.fstat(fileobj.fileno()).st_size:
+            return  # mmap can't map empty files
+        data = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for line in iter_lines(data):
+                yield line
+        finally:
+            data.close()
+    finally:
+        fileobj.close()
+
+
+class RecordIndex(object):
+    """Byte offsets of the records in a line based file for random access.
+
+    'satzarten' maps each record type to the offsets of the lines of this type. 'messages' is a list of
+    (startpos, endpos) byte ranges of the messages (e.g. invoices or orders) in the file, 'header' the
+    range of the lines preceding the first message. 'size' is the size of the indexed data.
+    Use build_index() to create an index and save() / load() to keep it in a sidecar file.
+    """
+
+    def __init__(self, satzarten=None, messages=None, header=(0, 0), size=0):
+        self.satzarten = satzarten or {}
+        self.messages = messages or []
+        self.header = tuple(header)
+        self.size = size
+
+    def __repr__(self):
+        return "<RecordIndex: %d messages, %d bytes>" % (len(self.messages), self.size)
+
+    def __len__(self):
+        return len(self.messages)
+
+    def _read(self, data, startpos, endpos):
+        """Read data[startpos:endpos] from a string, mmap or file object."""
+        if hasattr(data, 'seek') and not isinstance(data, mmap.mmap):
+            data.seek(startpos)
+            return data.read(endpos - startpos)
+        return data[startpos:endpos]
+
+    def get_message(self, data, number, with_header=True):
+        """Returns the raw data of message number from data (a string, mmap or file object).
+
+        If with_header is True the lines preceding the first message (e.g. the interchange header) are
+        prepended so the result can be fed to the parsers like a complete file."""
+        startpos, endpos = self.messages[number]
+        ret = self._read(data, startpos, endpos)
+        if with_header and self.header[1] > self.header[0]:
+            ret = self._read(data, *self.header) + ret
+        return ret
+
+    def save(self, filename):
+        """Write the index to filename, by convention the name of the indexed file + '.idx'."""
+        fileobj = open(filename, 'w')
+        try:
+            json.dump(dict(satzarten=self.satzarten, messages=self.messages, header=self.header,
+                           size=self.size), fileobj)
+        finally:
+            fileobj.close()
+
+    @classmethod
+    def load(cls, filename):
+        """Read an index written by save()."""
+        fileobj = open(filename)
+        try:
+            data = json.load(fileobj)
+        finally:
+            fileobj.close()
+        return cls(dict([(str(key), value) for key, value in data['satzarten'].items()]),
+                   [tuple(message) for message in data['messages']], data['header'], data['size'])
+
+
+def build_index(data, satzartpos, boundaries):
+    """Build a RecordIndex for data (a string or mmap).
+
+    satzartpos is the (startpos, endpos) of the record type within each line, boundaries a list of
+    record types starting a new message. Lines too short to contain a record type are ignored.
+    """
+    satzstart, satzend = satzartpos
+    satzarten = {}
+    messages = []
+    header = None
+    for startpos, endpos in iter_offsets(data):
+        if endpos - startpos < satzend:
+            continue
+        satzart = data[startpos + satzstart:startpos + satzend]
+        satzarten.setdefault(satzart, []).append(startpos)
+        if satzart in boundaries:
+            if messages:
+                messages[-1] = (messages[-1][0], startpos)
+            else:
+                header = (0, startpos)
+            messages.append((startpos, len(data)))
+    if header is None:
+        header = (0, len(data))
+    return RecordIndex(satzarten, messages, header, len(data))
+
+
+def _get_checks(schema, offset):
+    """Returns a RecordSchema of the fields validate_file() has to check and (column, name, decode, valid)
+    for each of them - valid collects the data already found to be valid for the field."""
+    # data cut to the length of a plain Field without choices is always valid
+    checked = [field for dummy, dummy, field in schema.fields if type(field) is not Field or field.choices]
+    subset = schema.subset([field.name for field in checked])
+    return subset, [(offset + startpos + 1, field.name, field.decode, set())
+                    for startpos, dummy, field in subset.fields]
+
+
+def validate_file(data, classes, satzartpos, offset=0, pad=False):
+    """Check every line of data against the record class for its record type without parsing records.
+
+    data is a string, mmap or an iterable of lines, see iter_lines(). classes maps the record types - found
+    at satzartpos (startpos, endpos) within each line - to classes generated by
+    generate_field_datensatz_class(). The records start at offset within the lines and have to end with the
+    line, otherwise the line is reported as too short or too long. With pad=True shorter lines are padded with
+    spaces at the end and longer ones truncated instead, like edilib.cctop.orders.parse_rawdata() does.
+    Formats adjusting lines otherwise have to prepare the lines accordingly. Blank lines are skipped.
+
+    The fields are checked like parse() does: their length, choices, the values of FixedFields, EAN check
+    digits, dates, numbers etc. Data found to be valid for a field is remembered, so values recurring in
+    many lines are checked only once.
+
+    Returns a list of (lineno, column, fieldname, message) for every violation found, lineno and column
+    counting from 1. Lines with an unknown record type or a wrong length are reported with fieldname None.
+    """
+    satzstart, satzend = satzartpos
+    checks = {}
+    violations = []
+    lineno = 0
+    for line in iter_lines(data):
+        lineno += 1
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            continue
+        satzart = line[satzstart:satzend]
+        klass = classes.get(satzart)
+        if klass is None:
+            violations.append((lineno, satzstart + 1, None, "unknown record type %r" % satzart))
+            continue
+        if klass not in checks:
+            checks[klass] = _get_checks(klass.schema, offset)
+        schema, fields = checks[klass]
+        record = line[offset:]
+        if len(record) != schema.length:
+            if not pad:
+                violations.append((lineno, schema.length + offset + 1, None,
+                                   "record has length %d instead of %d" % (len(record), schema.length)))
+                continue
+            record = record[:schema.length].ljust(schema.length)
+        for chunk, (column, name, decode, valid) in zip(schema.split(record), fields):
+            if chunk in valid:
+                continue
+            try:
+                decode(chunk)
+            except Exception, e:
+                violations.append((lineno, column, name, str(e)))
+            else:
+                # don't let unique values like order numbers fill up the memory
+                if len(valid) < 4096:
+                    valid.add(chunk)
+    return violations
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
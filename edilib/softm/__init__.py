@@ -7,8 +7,10 @@ Created by Maximillian Dornseif on 2010-09-07.
 Copyright (c) 2010 HUDORA. All rights reserved.
 """
 
-from edilib.softm.structure import parse_to_objects
+from edilib.softm.structure import parse_to_objects, iter_objects
 from edilib.softm.content import SoftMInvoiceConverter, SoftMABConverter
+from edilib.softm.scanner import scan_invoices
 
 
-__all__ = ['parse_to_objects', 'SoftMInvoiceConverter', 'SoftMABConverter']
+__all__ = ['parse_to_objects', 'iter_objects', 'SoftMInvoiceConverter', 'SoftMABConverter',
+           'scan_invoices']
@@ -21,8 +21,8 @@ import os
 
 def get_text(records, separator=' '):
     """Konkateniet Textzeilen aus SoftM-Textsatz und gib eine Liste von Texten zurück."""
-    # Manchmal ist `record` eine Liste und manchmal direkt eine
-    # `edilib.softm.structure.Struct` - wir müssen hier mit beidem umgehen können.
+    # Manchmal ist `record` eine Liste und manchmal direkt ein
+    # Datensatz aus `edilib.softm.structure` - wir müssen hier mit beidem umgehen können.
     if not isinstance(records, list):
         records = [records]
     ret = []
@@ -33,10 +33,29 @@ def get_text(records, separator=' '):
 
 
 class SoftMConverter(object):
-    """Base class for the various SoftM filetypes"""
+    """Base class for the various SoftM filetypes
+
+    Ist scaled gesetzt, werden die Beträge in scaled_fields als int in tausendstel Euro statt als Decimal
+    geparst und von cent() ohne Umweg über Decimal umgerechnet. Die Beträge im Ergebnis sind dann ints
+    statt Decimals."""
 
     file_records = ['XH']
     position_prefix = ''
+    scaled = False
+    # Beträge (mit 3 Nachkommastellen), die cent() übergeben werden, je Satzart
+    scaled_fields = {}
+
+    def cent(self, amount):
+        """Rechnet einen Betrag aus einem SoftM-Datensatz in Cent um, wie huTools.monetary.euro_to_cent()."""
+        if not self.scaled:
+            return huTools.monetary.euro_to_cent(amount)
+        # amount ist in tausendstel Euro, gerundet wird wie bei euro_to_cent() mit ROUND_HALF_DOWN
+        cent, rest = divmod(abs(amount), 10)
+        if rest > 5:
+            cent += 1
+        if amount < 0:
+            return -cent
+        return cent
 
     def get_recordname(self, recordtype):
         """Convenience Method for resolving record name"""
@@ -50,6 +69,7 @@ class SoftMConverter(object):
     def parse(self, data):
         """Parse input data into records
 
+        data can be a string, a mmap or an iterable of lines (see edilib.recordbased.mmap_lines()).
         Returns a list of (dict of records and a list of position)
         """
 
@@ -77,7 +97,7 @@ class SoftMConverter(object):
         files = []
 
         # rohe Datensätze aus der Eingagsdatei
-        record_list = edilib.softm.structure.parse_to_objects(data.split('\n'))
+        record_list = edilib.softm.structure.iter_objects(data, scaled=self.scaled and self.scaled_fields)
 
         records, position = None, None
         positions = []
@@ -138,10 +158,10 @@ class SoftMConverter(object):
             kundenartnr=position.artnr_kunde,
             name=position.artikelbezeichnung.strip(),
             infotext_kunde=[position.artikelbezeichnung_kunde],
-            einzelpreis=huTools.monetary.euro_to_cent(position.verkaufspreis),
-            warenwert=huTools.monetary.euro_to_cent(position.wert_netto),
-            zu_zahlen=huTools.monetary.euro_to_cent(position.wert_brutto),
-            abschlag=huTools.monetary.euro_to_cent(-1 * rabatt.positionsrabatt_gesamt),
+            einzelpreis=self.cent(position.verkaufspreis),
+            warenwert=self.cent(position.wert_netto),
+            zu_zahlen=self.cent(position.wert_brutto),
+            abschlag=self.cent(-1 * rabatt.positionsrabatt_gesamt),
             ursprungsland=position.ursprungsland,
             #steuersatz=position.steuersatz,
             #steuerbetrag=position.steuerbetrag,
@@ -237,6 +257,10 @@ class SoftMInvoiceConverter(SoftMConverter):
 
     position_prefix = 'F'
     file_records = ['XH', 'R1', 'R2', 'R3']
+    scaled_fields = dict(F1=['skontobetrag1_ust1'], F3=['verkaufspreis', 'wert_netto', 'wert_brutto'],
+                         F4=['positionsrabatt_gesamt'],
+                         F9=['versandkosten1', 'warenwert', 'mehrwertsteuer', 'gesamtbetrag', 'summe_rabatte',
+                             'skontoabzug'])
     header_records = ['F1', 'F2', 'FV', 'FL', 'FK', 'F8', 'F9', 'FX', 'FA', 'FE']
     position_records = ['F3', 'F4', 'FR', 'FP', 'F5', 'F6']
 
@@ -283,20 +307,20 @@ class SoftMInvoiceConverter(SoftMConverter):
             leistungsdatum=f1.lieferscheindatum,
             infotext_kunde=str(f1.lieferantennummer).strip(),
 
-            versandkosten=huTools.monetary.euro_to_cent(f9.versandkosten1),
-            warenwert=huTools.monetary.euro_to_cent(abs(f9.warenwert)),
+            versandkosten=self.cent(f9.versandkosten1),
+            warenwert=self.cent(abs(f9.warenwert)),
 
             # summe_zuschlaege=f9.summe_zuschlaege,
             # Rechnungsbetrag ohne Steuer und Abzüge als String mit zwei Nachkommastellen.
             # Entspricht Warenwert - Abschlag
             # rechnungsbetrag='?5',
-            rechnung_steueranteil=huTools.monetary.euro_to_cent(f9.mehrwertsteuer),
+            rechnung_steueranteil=self.cent(f9.mehrwertsteuer),
             steuer_prozent="19",
             # Der Betrag, denn der Kunde Zahlen muss - es sei denn, er zieht Skonto
-            zu_zahlen=huTools.monetary.euro_to_cent(f9.gesamtbetrag),
+            zu_zahlen=self.cent(f9.gesamtbetrag),
             # Rechnungsbetrag ohne Steuer und Abz<C3><BC>ge als String mit zwei Nachkommastellen.
             # Entspricht warenwert - abschlag oder zu_zahlen - rechnung_steueranteil
-            rechnungsbetrag=huTools.monetary.euro_to_cent((f9.gesamtbetrag - f9.mehrwertsteuer)),
+            rechnungsbetrag=self.cent((f9.gesamtbetrag - f9.mehrwertsteuer)),
 
             zahlungstage=f1.nettotage,
             #skontofaehig=huTools.monetary.euro_to_cent(abs(f9.skontofaehig)),
@@ -327,7 +351,7 @@ class SoftMInvoiceConverter(SoftMConverter):
             if text2 and f9.kopfrabatt2_prozent:
                 text2 = "%s (%s %%)" % (text2, f9.kopfrabatt2_prozent)
             kopf['abschlag_text'] = ', '.join([x for x in [text1, text2] if x])
-            kopf['abschlag'] = huTools.monetary.euro_to_cent(f9.summe_rabatte)  # = f9.kopfrabatt1 + f9.kopfrabatt2
+            kopf['abschlag'] = self.cent(f9.summe_rabatte)  # = f9.kopfrabatt1 + f9.kopfrabatt2
             kopf['hint']['abschlag_prozent'] = "%.2f" % float(str(f9.kopfrabatt1_prozent + f9.kopfrabatt2_prozent))
             # 'kopfrabatt1_vorzeichen', fieldclass=FixedField, default='+'),
             # 'kopfrabatt2_vorzeichen', fieldclass=FixedField, default='+'),
@@ -335,9 +359,9 @@ class SoftMInvoiceConverter(SoftMConverter):
         if f1.skontotage1:
             kopf['skontotage'] = f1.skontotage1
             kopf['skonto_prozent'] = f1.skonto1
-            kopf['zu_zahlen_bei_skonto'] = huTools.monetary.euro_to_cent(f9.gesamtbetrag - f1.skontobetrag1_ust1)
+            kopf['zu_zahlen_bei_skonto'] = self.cent(f9.gesamtbetrag - f1.skontobetrag1_ust1)
             kopf['hint']['skontodatum'] = f1.skontodatum1
-            kopf['hint']['skontobetrag'] = huTools.monetary.euro_to_cent(abs(f9.skontoabzug))
+            kopf['hint']['skontobetrag'] = self.cent(abs(f9.skontoabzug))
 
             # huTools.monetary.tara
             tmp = kopf['zu_zahlen_bei_skonto'] - huTools.monetary.netto(kopf['zu_zahlen_bei_skonto'])
@@ -499,6 +523,11 @@ class SoftMABConverter(SoftMConverter):
     """Converter for AB files"""
 
     position_prefix = 'A'
+    scaled_fields = dict(A1=['skontobetrag1_ust1'], A3=['verkaufspreis', 'wert_netto', 'wert_brutto'],
+                         A4=['positionsrabatt_gesamt'],
+                         A9=['nettowarenwert', 'gesamtbetrag', 'mehrwertsteuer', 'versandkosten1',
+                             'steuerpflichtig_ust1', 'skontofaehig', 'skontoabzug', 'summe_zuschlaege',
+                             'summe_rabatte', 'kopfrabatt1', 'kopfrabatt2'])
 
     # Datensätze, die genau einmal pro Auftrag auftreten und
     # Texte: Versandart, Lieferbedingungen, Nebenkosten, Kopftexte
@@ -536,26 +565,26 @@ class SoftMABConverter(SoftMConverter):
             kundenauftragsnr=a1.kundenbestellnummer,
 
             # Daten aus A9-Record
-            warenwert=huTools.monetary.euro_to_cent(abs(a9.nettowarenwert)),
+            warenwert=self.cent(abs(a9.nettowarenwert)),
             # Der Betrag, denn der Kunde zahlen muss - es sei denn, er zieht Skonto
-            zu_zahlen=huTools.monetary.euro_to_cent(a9.gesamtbetrag),
-            steueranteil=huTools.monetary.euro_to_cent(a9.mehrwertsteuer),
-            versandkosten=huTools.monetary.euro_to_cent(a9.versandkosten1),
+            zu_zahlen=self.cent(a9.gesamtbetrag),
+            steueranteil=self.cent(a9.mehrwertsteuer),
+            versandkosten=self.cent(a9.versandkosten1),
 
-            rechnungsbetrag=huTools.monetary.euro_to_cent(a9.steuerpflichtig_ust1),
-            skontofaehig=huTools.monetary.euro_to_cent(a9.skontofaehig),
-            skontoabzug=huTools.monetary.euro_to_cent(a9.skontoabzug),
+            rechnungsbetrag=self.cent(a9.steuerpflichtig_ust1),
+            skontofaehig=self.cent(a9.skontofaehig),
+            skontoabzug=self.cent(a9.skontoabzug),
             steuer_prozent=a9.steuersatz1,
 
             # Wird bei Rechnung addiert! TODO
             # kopf['abschlag'] = huTools.monetary.euro_to_cent(f9.summe_rabatte)  # = f9.kopfrabatt1 + f9.kopfrabatt2
-            summe_zuschlaege=huTools.monetary.euro_to_cent(a9.summe_zuschlaege),
-            summe_rabatte=huTools.monetary.euro_to_cent(a9.summe_rabatte),
+            summe_zuschlaege=self.cent(a9.summe_zuschlaege),
+            summe_rabatte=self.cent(a9.summe_rabatte),
 
-            kopfrabatt1=huTools.monetary.euro_to_cent(a9.kopfrabatt1),
+            kopfrabatt1=self.cent(a9.kopfrabatt1),
             kopfrabatt1_pct=a9.kopfrabatt1_prozent,
             textschluessel1=a9.textschluessel1,
-            kopfrabatt2=huTools.monetary.euro_to_cent(a9.kopfrabatt2),
+            kopfrabatt2=self.cent(a9.kopfrabatt2),
             kopfrabatt2pct=a9.kopfrabatt2_prozent,
             textschluessel2=a9.textschluessel2,
 
@@ -578,14 +607,14 @@ class SoftMABConverter(SoftMConverter):
                 kopf['abschlag_text'].append("Rabatt (%.2f %%)" % a9.kopfrabatt2_prozent)
             kopf['abschlag_text'] = ', '.join(kopf['abschlag_text'])
             # Abschlag = a9.kopfrabatt1 + a9.kopfrabatt2
-            kopf['abschlag'] = huTools.monetary.euro_to_cent(-a9.summe_rabatte)
+            kopf['abschlag'] = self.cent(-a9.summe_rabatte)
             kopf['hint']['abschlag_prozent'] = "%.2f" % float(str(a9.kopfrabatt1_prozent + a9.kopfrabatt2_prozent))
 
         if a1.skontotage1:
             kopf['skontotage'] = a1.skontotage1
             kopf['skonto_prozent'] = a1.skonto1
-            kopf['zu_zahlen_bei_skonto'] = huTools.monetary.euro_to_cent(a9.gesamtbetrag - a1.skontobetrag1_ust1)
-            kopf['hint']['skontobetrag'] = huTools.monetary.euro_to_cent(abs(a9.skontoabzug))
+            kopf['zu_zahlen_bei_skonto'] = self.cent(a9.gesamtbetrag - a1.skontobetrag1_ust1)
+            kopf['hint']['skontobetrag'] = self.cent(abs(a9.skontoabzug))
 
             # huTools.monetary.tara
             tmp = kopf['zu_zahlen_bei_skonto'] - huTools.monetary.netto(kopf['zu_zahlen_bei_skonto'])
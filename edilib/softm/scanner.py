@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+scanner.py - schneller Überblick über die Rechnungen in einer SoftM EDI-Datei.
+
+Statt die komplette Konvertierung mit SoftMInvoiceConverter durchzuführen, werden nur die
+F1 (Rechnungskopf) und F9 (Rechnungsende) Sätze gelesen und daraus nur die Felder dekodiert, die für
+eine Übersicht nötig sind. Die Positionen der Felder stammen aus FELDERF1 und FELDERF9.
+
+Copyright (c) 2010 HUDORA. All rights reserved.
+"""
+
+from edilib.recordbased import iter_lines
+from edilib.softm.structure import get_satzresolver, peek_satzart, split_line
+
+
+F1FELDER = ['rechnungsnr', 'rechnungsdatum', 'rechnungsempfaenger']
+F9FELDER = ['gesamtbetrag']
+
+
+def scan_invoices(data):
+    """Liefert für jede Rechnung in data ein dict mit rechnungsnr, rechnungsdatum, rechnungsempfaenger
+    und gesamtbetrag.
+
+    data kann ein String, ein mmap oder ein Iterable von Zeilen sein (siehe
+    edilib.recordbased.mmap_lines()). Fehlt der F9 Satz einer Rechnung, ist gesamtbetrag None.
+    """
+    satzresolver = get_satzresolver()
+    f1klasse = satzresolver['F1'].projection(F1FELDER)
+    f9klasse = satzresolver['F9'].projection(F9FELDER)
+    summary = None
+    for rawline in iter_lines(data):
+        # Schneller Test der Satzart - ohne die Zeile zu zerlegen, solange split_line() sie
+        # nicht verschieben würde
+        if peek_satzart(rawline) not in (None, 'F1', 'F9'):
+            continue
+        parts = split_line(rawline)
+        if not parts:
+            continue
+        satzart, dummy, satzdata, dummy = parts
+        if satzart == 'F1':
+            if summary:
+                yield summary
+            f1 = f1klasse.from_data(satzdata)
+            summary = dict(rechnungsnr=f1.rechnungsnr, rechnungsdatum=f1.rechnungsdatum,
+                           rechnungsempfaenger=f1.rechnungsempfaenger, gesamtbetrag=None)
+        elif satzart == 'F9' and summary:
+            summary['gesamtbetrag'] = f9klasse.from_data(satzdata).gesamtbetrag
+            yield summary
+            summary = None
+    if summary:
+        yield summary
@@ -11,8 +11,11 @@ Copyright (c) 2007, 2008, 2010 HUDORA GmbH. All rights reserved.
 
 
 import datetime
+import multiprocessing
 from edilib.recordbased import generate_field_datensatz_class, DateField, TimeField, BooleanField
 from edilib.recordbased import IntegerField, DecimalFieldNoDot, DecimalFieldNoDotSigned, FixedField, EanField
+from edilib.recordbased import iter_lines, build_index as build_recordindex
+from edilib.recordbased import validate_file as validate_recordfile
 
 
 doctext = """Diese Satzart enthält allgemeine Angaben zur empfangenen EDIFACT-Nachricht und kennzeichnet
@@ -884,10 +887,24 @@ FELDERTEXT = [
 for feld in FELDERTEXT:
     feld['startpos'] = feld['startpos'] - 1
 TEXTsatzklasse = generate_field_datensatz_class(FELDERTEXT, name='generic_text', length=496)
+AVsatzklasse = generate_field_datensatz_class(FELDERTEXT, name='versandarttext', length=496)
+ALsatzklasse = generate_field_datensatz_class(FELDERTEXT, name='lieferbedinungstext', length=496)
+ANsatzklasse = generate_field_datensatz_class(FELDERTEXT, name='nebenkostentext', length=496)
+AKsatzklasse = generate_field_datensatz_class(FELDERTEXT, name='kopftext', length=496)
+APsatzklasse = generate_field_datensatz_class(FELDERTEXT, name='positionstext', length=496)
+AXsatzklasse = generate_field_datensatz_class(FELDERTEXT, name='kopfrabatttext', length=496)
+AEsatzklasse = generate_field_datensatz_class(FELDERTEXT, name='endetext', length=496)
+ARsatzklasse = generate_field_datensatz_class(FELDERTEXT, name='positionsrabatttext', length=496)
+FRsatzklasse = generate_field_datensatz_class(FELDERTEXT, name='rechnungspositionsrabatttext', length=496)
+FPsatzklasse = generate_field_datensatz_class(FELDERTEXT, name='rechnungspositionstext', length=496)
+FKsatzklasse = generate_field_datensatz_class(FELDERTEXT, name='rechnungskopftext', length=496)
+FXsatzklasse = generate_field_datensatz_class(FELDERTEXT, name='rechnungskopfrabatttext', length=496)
+FEsatzklasse = generate_field_datensatz_class(FELDERTEXT, name='endtexte', length=496)
 
 
 # from http://stackoverflow.com/questions/1305532/convert-python-dict-to-object
 # see huTools.structured.Struct for a more sophisticated implementation.
+# parse_to_objects() used to return these, now it returns the Datensätze directly.
 class Struct:
     def __init__(self, **entries):
         self.__dict__.update(entries)
@@ -896,9 +913,13 @@ class Struct:
         return "<Struct: %r>" % self.__dict__
 
 
-def parse_to_objects(lines):
-    """Implementiert das Parsen einer liste von SoftM EDI-Datensätzen in Objekte."""
-    satzresolver = dict(XH=XHsatzklasse,
+# Satzart -> Klasse, wird beim ersten Aufruf von get_satzresolver() einmal pro Prozess aufgebaut
+_satzresolver = None
+
+
+def _build_satzresolver():
+    """Erzeugt die Zuordnung von Satzart zu Klasse für alle bekannten Satzarten."""
+    return dict(XH=XHsatzklasse,
         F1=F1satzklasse,
         F2=F2satzklasse,
         F3=F3satzklasse,
@@ -918,55 +939,239 @@ def parse_to_objects(lines):
         A6=A6satzklasse,
         A8=A8satzklasse,
         A9=A9satzklasse,
-        AV=generate_field_datensatz_class(FELDERTEXT, name='versandarttext', length=496),
-        AL=generate_field_datensatz_class(FELDERTEXT, name='lieferbedinungstext', length=496),
-        AN=generate_field_datensatz_class(FELDERTEXT, name='nebenkostentext', length=496),
-        AK=generate_field_datensatz_class(FELDERTEXT, name='kopftext', length=496),
-        AP=generate_field_datensatz_class(FELDERTEXT, name='positionstext', length=496),
-        AX=generate_field_datensatz_class(FELDERTEXT, name='kopfrabatttext', length=496),
-        AE=generate_field_datensatz_class(FELDERTEXT, name='endetext', length=496),
-        AR=generate_field_datensatz_class(FELDERTEXT, name='positionsrabatttext', length=496),
+        AV=AVsatzklasse,
+        AL=ALsatzklasse,
+        AN=ANsatzklasse,
+        AK=AKsatzklasse,
+        AP=APsatzklasse,
+        AX=AXsatzklasse,
+        AE=AEsatzklasse,
+        AR=ARsatzklasse,
 
         R1=R1satzklasse,
         R2=R2satzklasse,
         R3=R3satzklasse,
         FA=FAsatzklasse,
-        FR=generate_field_datensatz_class(FELDERTEXT, name='positionsrabatttext', length=496),
-        FP=generate_field_datensatz_class(FELDERTEXT, name='positionstext', length=496),
-        FK=generate_field_datensatz_class(FELDERTEXT, name='kopftext', length=496),
-        FX=generate_field_datensatz_class(FELDERTEXT, name='kopfrabatttext', length=496),
-        FE=generate_field_datensatz_class(FELDERTEXT, name='endtexte', length=496),
+        FR=FRsatzklasse,
+        FP=FPsatzklasse,
+        FK=FKsatzklasse,
+        FX=FXsatzklasse,
+        FE=FEsatzklasse,
         # FV Versandarttexte
         # FL Lieferbedingungstexte
         # FN Nebenkosten
         )
-    ret = []
+
+
+def get_satzresolver():
+    """Gibt das dict mit der Zuordnung von Satzart zu Klasse zurück."""
+    global _satzresolver
+    if _satzresolver is None:
+        _satzresolver = _build_satzresolver()
+    return _satzresolver
+
+
+def register_satzklasse(satzart, satzklasse):
+    """Registriert eine (zusätzliche) Satzart, z.B. register_satzklasse('FV', TEXTsatzklasse)."""
+    get_satzresolver()[satzart] = satzklasse
+
+
+def split_line(rawline):
+    """Zerlegt eine Zeile einer SoftM EDI-Datei in (satzart, version, daten, erstellungsdatum).
+
+    daten ist der eigentliche Datensatz (496 Bytes). Für leere Zeilen wird None zurückgegeben."""
+    # remove newline & EOF
+    line = rawline.rstrip('\r\n').strip(' \x1a')
+    if not line:
+        return None
+    # remove erstellungsdatum
+    erstellungsdatum = line[519:]
+    line = line[:519]
+    # remove line-header
+    line = line[19:]
+    # pad line if it is to short now
+    line = "% 500s" % line
+    return line[:2], line[2:4], line[4:], erstellungsdatum
+
+
+def peek_satzart(rawline):
+    """Gibt die Satzart einer Zeile zurück, ohne die Zeile zu zerlegen.
+
+    Für Zeilen, die split_line() durch Abschneiden oder Auffüllen verschieben würde (leere, zu kurze und
+    mit Leerzeichen oder ^Z beginnende Zeilen), wird None zurückgegeben - diese Zeilen müssen mit
+    split_line() zerlegt werden."""
+    # split_line() verschiebt nichts, solange nach dem Entfernen von Zeilenende, Leerzeichen und ^Z noch
+    # mindestens 519 Bytes übrig bleiben - dazu reicht ein Blick auf das Ende der Zeile
+    if rawline[:1] in ' \x1a' or not rawline[518:].rstrip('\r\n').rstrip(' \x1a'):
+        return None
+    return rawline[19:21]
+
+
+def _get_projected_satzresolver(projection):
+    """Gibt die Zuordnung von Satzart zu Klasse für die Satzarten und Felder in projection zurück."""
+    satzresolver = get_satzresolver()
+    ret = {}
+    for satzart, names in projection.items():
+        if satzart not in satzresolver:
+            raise ValueError("unbekannter Satz: %r" % satzart)
+        if names is None:
+            ret[satzart] = satzresolver[satzart]
+        else:
+            ret[satzart] = satzresolver[satzart].projection(names)
+    return ret
+
+
+def _get_scaled_satzresolver(satzresolver, scaled):
+    """Ersetzt in satzresolver die Klassen der Satzarten in scaled durch Varianten mit skalierten Feldern."""
+    satzresolver = dict(satzresolver)
+    for satzart, names in scaled.items():
+        if satzart in satzresolver:
+            satzklasse = satzresolver[satzart]
+            if names is not None:
+                # bei einer projection sind nicht unbedingt alle Felder vorhanden
+                names = [name for name in names if name in satzklasse.schema.index]
+            satzresolver[satzart] = satzklasse.scaled(names)
+    return satzresolver
+
+
+def _get_resolver(projection, scaled):
+    """Gibt die Zuordnung von Satzart zu Klasse für iter_objects() und parse_to_objects() zurück."""
+    if projection is None:
+        satzresolver = get_satzresolver()
+    else:
+        satzresolver = _get_projected_satzresolver(projection)
+    if scaled:
+        satzresolver = _get_scaled_satzresolver(satzresolver, scaled)
+    return satzresolver
+
+
+def iter_objects(fileobj, projection=None, scaled=None, validate=True, reuse=False):
+    """Parst SoftM EDI-Datensätze und liefert sie einzeln als (satzart, Datensatz) zurück.
+
+    Die Datensätze sind Instanzen der Satzklassen aus get_satzresolver(). Diese speichern nur eine Liste
+    der Werte, auf die Felder wird wie gewohnt per Attribut zugegriffen.
+
+    Jeder Datensatz wird geliefert, sobald er gelesen ist, der Speicherbedarf hängt also nicht von der
+    Größe der Datei ab. fileobj kann ein Dateiobjekt, ein String, ein mmap oder ein beliebiges Iterable
+    von Zeilen sein.
+
+    Mit projection werden nur ausgewählte Satzarten und Felder geparst: projection bildet Satzarten auf
+    eine Liste von Feldnamen (oder None für alle Felder) ab, z.B. {'F1': ['rechnungsnr'], 'F9': None}.
+    Zeilen anderer Satzarten werden übersprungen, die Datensätze enthalten nur die angegebenen Felder.
+
+    Mit scaled werden Dezimalfelder als int statt als Decimal geliefert, skaliert mit 10 ** precision -
+    bei Beträgen in SoftM also in tausendstel Euro. scaled bildet wie projection Satzarten auf eine Liste
+    von Feldnamen (oder None für alle Dezimalfelder) ab, z.B. {'F9': ['gesamtbetrag']}.
+
+    Mit validate=False werden die Felder nur geparst und nicht weiter geprüft (Länge, Auswahlwerte,
+    Prüfziffern von EANs), siehe edilib.recordbased.DatensatzBaseClass.parse(). Das ist für Dateien aus
+    unserem eigenen SoftM gedacht.
+
+    Mit reuse=True wird pro Satzart immer dieselbe Instanz geliefert und für die nächste Zeile dieser
+    Satzart wiederverwendet, siehe edilib.recordbased.DatensatzBaseClass.parse_into(). Die Datensätze
+    dürfen dann nicht aufbewahrt werden, sondern nur ihre Werte.
+    """
+    satzresolver = _get_resolver(projection, scaled)
+    satzcache = {}
     lineno = 0
-    for rawline in lines:
+    for rawline in iter_lines(fileobj):
         lineno += 1
-        # remove newline & EOF
-        line = rawline.rstrip('\r\n').strip(' \x1a')
-        if not line:
+        if projection is not None:
+            satzart = peek_satzart(rawline)
+            if satzart is not None and satzart not in satzresolver:
+                # Satzart ist nicht gefragt - die Zeile wird gar nicht erst zerlegt
+                continue
+        parts = split_line(rawline)
+        if not parts:
             # skip empty lines
             continue
-        # remove erstellungsdatum
-        erstellungsdatum = line[519:]
-        line = line[:519]
-        # remove line-header
-        line = line[19:]
-        # pad line if it is to short now
-        line = "% 500s" % line
-        satzart, version, data = line[:2], line[2:4], line[4:]
+        satzart, version, data, erstellungsdatum = parts
         satzklasse = satzresolver.get(satzart, None)
         if satzklasse:
-            satz = satzklasse()
-            satz.parse(data)
-            ret.append((satzart, Struct(**satz.as_dict())))
-            del satz
+            if not reuse:
+                yield satzart, satzklasse.from_data(data, validate=validate)
+            elif satzart in satzcache:
+                yield satzart, satzklasse.parse_into(data, satzcache[satzart], validate=validate)
+            else:
+                satzcache[satzart] = satzklasse.from_data(data, validate=validate)
+                yield satzart, satzcache[satzart]
+        elif projection is not None:
+            continue
         else:
             print "Zeile %s:" % lineno, repr(satzart), repr(version), repr(erstellungsdatum),
-            print len(line), len(data)
+            print len(rawline), len(data)
             print "unbekannter Satz:", satzart, version
             print repr(rawline)
             raise RuntimeError("unbekannter Satz: %r %r" % (str(satzart), str(version)))
+
+
+def build_index(data):
+    """Erzeugt einen edilib.recordbased.RecordIndex für eine SoftM EDI-Datei (String oder mmap).
+
+    Nachrichten beginnen mit einem F1 (Rechnung) oder A1 (Auftrag) Satz. Mit
+    index.get_message(data, n) kann dann eine einzelne Nachricht samt XH Satz z.B. an
+    SoftMInvoiceConverter.convert() übergeben werden."""
+    return build_recordindex(data, (19, 21), ['F1', 'A1'])
+
+
+def validate_file(data):
+    """Prüft eine SoftM EDI-Datei (String, mmap oder Iterable von Zeilen), ohne Datensätze zu erzeugen.
+
+    Gibt eine Liste mit (Zeilennummer, Spalte, Feldname, Meldung) für jeden Fehler zurück, siehe
+    edilib.recordbased.validate_file(). Die Zeilen werden wie beim Parsen mit split_line() zerlegt, zu
+    kurze Zeilen werden also auch hier vorne aufgefüllt und zu lange abgeschnitten, ihre Länge wird nicht
+    geprüft. Die Spalten beziehen sich auf die so aufgefüllte Zeile."""
+
+    def lines():
+        for rawline in iter_lines(data):
+            parts = split_line(rawline)
+            # leere Zeilen werden übersprungen, zählen aber für die Zeilennummern
+            yield ''.join(parts[:3]) if parts else ''
+
+    # Satzart und Version stehen nach dem Zeilenkopf von 19 Bytes, den split_line() entfernt hat
+    return [(lineno, column + 19, name, message) for lineno, column, name, message
+            in validate_recordfile(lines(), get_satzresolver(), (0, 2), offset=4)]
+
+
+def _parse_chunk(args):
+    """Parst einen Block von Zeilen in einem Worker-Prozess von parse_to_objects()."""
+    lines, projection, scaled, validate = args
+    # Datensätze werden als Liste ihrer Werte zurück übertragen, die Instanzen selbst werden nicht gebraucht
+    return [(satzart, satz._values)
+            for satzart, satz in iter_objects(lines, projection, scaled, validate, reuse=True)]
+
+
+def _iter_chunks(lines, chunksize, projection, scaled, validate):
+    """Teilt lines in Blöcke von chunksize Zeilen für _parse_chunk() auf."""
+    chunk = []
+    for line in iter_lines(lines):
+        chunk.append(line)
+        if len(chunk) >= chunksize:
+            yield chunk, projection, scaled, validate
+            chunk = []
+    if chunk:
+        yield chunk, projection, scaled, validate
+
+
+def parse_to_objects(lines, projection=None, parallel=None, chunksize=5000, scaled=None, validate=True):
+    """Implementiert das Parsen einer liste von SoftM EDI-Datensätzen in Objekte.
+
+    Zu projection, scaled und validate siehe iter_objects(). Mit parallel=N werden die Zeilen in Blöcke von
+    chunksize Zeilen aufgeteilt und von N Prozessen geparst. Das Ergebnis ist dasselbe wie ohne parallel,
+    insbesondere bleibt die Reihenfolge der Datensätze erhalten. Mit register_satzklasse() registrierte
+    Satzarten müssen vor dem Aufruf registriert sein."""
+    if not parallel or parallel < 2:
+        return list(iter_objects(lines, projection, scaled, validate))
+
+    satzresolver = _get_resolver(projection, scaled)
+    pool = multiprocessing.Pool(parallel)
+    try:
+        ret = []
+        for chunk in pool.imap(_parse_chunk, _iter_chunks(lines, chunksize, projection, scaled, validate)):
+            ret.extend([(satzart, satzresolver[satzart].from_values(values)) for satzart, values in chunk])
+    finally:
+        # nach dem letzten Block haben die Prozesse nichts mehr zu tun, nach einem Fehler sollen sie nicht
+        # weiter parsen
+        pool.terminate()
+        pool.join()
     return ret
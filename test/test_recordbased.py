@@ -10,6 +10,10 @@ Copyright (c) 2007 HUDORA GmbH. All rights reserved.
 import unittest
 from edilib.recordbased import *
 import datetime
+import mmap
+import pickle
+import tempfile
+from decimal import Decimal, InvalidOperation
 
 
 # Der code hat einen Sack voll Tests die nicht laufen, bz.w. auskommentiert sind,
@@ -68,6 +72,24 @@ class FieldTestsString(unittest.TestCase):
         fieldinstance.parse('             ')
         self.assertEqual(str(fieldinstance), '')
 
+    def test_validate_eans(self):
+        """Test checking a column of EANs at once."""
+        self.assertEqual(validate_eans(['4005998000007', '', '4005998000000', ' 4005998000007 ', 'ABC', '1234']),
+                         [(2, '4005998000000'), (4, 'ABC'), (5, '1234')])
+        self.assertEqual(validate_eans(iter(['40059983', '40059982'])), [(1, '40059982')])
+        self.assertEqual(validate_eans([]), [])
+
+    def test_checkdigit_cache(self):
+        """Test that only the most recently used check digits are remembered."""
+        from edilib.recordbased import _LRUCache
+        calls = []
+        cache = _LRUCache(lambda value: calls.append(value) or value * 2, 2)
+        self.assertEqual([cache(1), cache(2), cache(1), cache(3)], [2, 4, 2, 6])
+        self.assertEqual(calls, [1, 2, 3])
+        self.assertEqual(len(cache), 2)
+        self.assertEqual([cache(1), cache(2)], [2, 4])
+        self.assertEqual(calls, [1, 2, 3, 2])
+
 
 class FieldTestsNumeric(unittest.TestCase):
     """Test for Field and it's descendants."""
@@ -184,6 +206,52 @@ class FieldTestsNumeric(unittest.TestCase):
         fieldinstance.parse('017000 ')
         self.assertEqual(fieldinstance.get(), 17)
 
+    def test_decimal_scaled(self):
+        """Test DecimalFields decoding into scaled ints."""
+        fieldinstance = DecimalField('name', 8, precision=2, scaled=True)
+        self.assertEqual(fieldinstance.decode('  -12.5 '), -1250)
+        self.assertEqual(fieldinstance.format(-1250), '  -12.50')
+        fieldinstance = DecimalFieldNoDot('name', length=6, precision=3, scaled=True)
+        self.assertEqual(fieldinstance.decode(' 12500'), 12500)
+        self.assertEqual(fieldinstance.format(5), '  0005')
+        self.assertRaises(InvalidOperation, fieldinstance.decode, ' -  12')  # like without scaled
+        fieldinstance = DecimalFieldNoDotSigned('name', length=7, precision=3, scaled=True)
+        self.assertEqual(fieldinstance.decode('001250-'), -1250)
+        self.assertEqual(fieldinstance.format(-1250), '001250-')
+        self.assertRaises(InvalidData, fieldinstance.decode, '001250*')
+        self.assertRaises(InvalidFieldDefinition, DecimalField, 'name', 8, scaled=True)
+
+    def test_decimal_scaled_checks(self):
+        """Test scaled DecimalFields are checked like unscaled ones and never lose digits."""
+        for fieldtype, data in [(DecimalFieldNoDot, '   500'), (DecimalFieldNoDotSigned, '00500+'),
+                                (DecimalField, '  5.00')]:
+            fieldinstance = fieldtype('name', 6, precision=2, choices=[Decimal('1.00')])
+            self.assertRaises((FieldNoValidChoice, InvalidData), fieldinstance.decode, data)
+            fieldinstance = fieldtype('name', 6, precision=2, scaled=True, choices=[Decimal('1.00')])
+            self.assertRaises((FieldNoValidChoice, InvalidData), fieldinstance.decode, data)
+            self.assertEqual(fieldinstance.decode(data, validate=False), 500)
+        fieldinstance = DecimalField('name', 8, precision=2, scaled=True)
+        self.assertRaises(InvalidData, fieldinstance.decode, '  12.345')
+        self.assertRaises(InvalidData, fieldinstance.decode, '  12.345', validate=False)
+        self.assertEqual(fieldinstance.decode('  12.340', validate=False), 1234)
+
+    def test_decimal_fast_paths(self):
+        """Test ints and Decimals are formated exactly, even when filling the whole field."""
+        fieldinstance = DecimalField('name', 8, precision=2)
+        self.assertEqual(fieldinstance.format(Decimal('-0.05')), '   -0.05')
+        self.assertEqual(fieldinstance.format(Decimal('12345.5')), '12345.50')
+        self.assertEqual(fieldinstance.format(Decimal('0.125')), '    0.12')  # rounded via float as before
+        fieldinstance = DecimalFieldNoDot('name', length=5, precision=2)
+        self.assertEqual(fieldinstance.format(Decimal('0.05')), '  005')
+        self.assertEqual(fieldinstance.format(-12), '-1200')
+        self.assertEqual(fieldinstance.decode(fieldinstance.format(743)), 743)
+        self.assertRaises(FieldTooLong, fieldinstance.format, 1000)
+        fieldinstance = DecimalFieldNoDotSigned('name', length=6, precision=2)
+        self.assertEqual(fieldinstance.format(Decimal('-0.05')), '00005-')
+        self.assertEqual(fieldinstance.format(999), '99900+')
+        self.assertRaises(FieldTooLong, fieldinstance.format, 1000)
+        self.assertRaises(FieldTooLong, fieldinstance.format, Decimal('-1000.5'))
+
 
 class FieldSpecial(unittest.TestCase):
     """Test for Field and it's descendants."""
@@ -407,6 +475,20 @@ class FieldParseTestsSpecial(unittest.TestCase):
         fieldinstance.parse('06052007')
         self.assertEqual(fieldinstance.value, datetime.date(2007, 5, 6))
 
+    def test_date_field_cache(self):
+        """Test parsing dates from the cache and without strptime."""
+        fieldinstance = DateField('name', 8)
+        otherinstance = DateField('other', 8)
+        self.assertEqual(fieldinstance.decode('20100228'), datetime.date(2010, 2, 28))
+        self.assertTrue('20100228' in otherinstance._cache)
+        self.assertEqual(otherinstance.decode('20100228'), datetime.date(2010, 2, 28))
+        self.assertTrue('28022010' not in DateFieldReverse('name', 8)._cache)
+        self.assertEqual(DateFieldReverse('name', 8).decode('28022010'), datetime.date(2010, 2, 28))
+        for data in ['20100229', '20101301', '2010 2 8', '2010022 ']:
+            self.assertRaises(InvalidData, fieldinstance.decode, data)
+        self.assertTrue('20100229' not in fieldinstance._cache)
+        self.assertRaises(InvalidData, TimeField('name', 4).decode, '1260')
+
     def test_time_field(self):
         """Test parsing of date field."""
         fieldinstance = TimeField('name', 4)
@@ -433,10 +515,26 @@ class FieldDatensatzBasic(unittest.TestCase):
         felder1 = [dict(name='feld1', length=3, startpos=1, endpos=4, fieldclass=Field)]
         klass = generate_field_datensatz_class(felder1, 'KlassenNameABC')
         instance1 = klass()
-        self.assertTrue('feld1_field' in vars(instance1).keys())
         self.assertEqual(type(instance1.feld1), type(''))
         self.assertEqual(instance1.feld1, '')
-        self.assertEqual(type(instance1.feld1_field), type(Field(name='foo')))
+        self.assertEqual(type(instance1.feld1_field.field), type(Field(name='foo')))
+        instance1.feld1_field.set('abc')
+        self.assertEqual(instance1.feld1, 'abc')
+        self.assertEqual(instance1.feld1_field.formated(), 'abc')
+
+    def test_shared_fields(self):
+        """Test that records of a class share their Field instances and only keep a value list."""
+        felder1 = [dict(name='feld1', length=3, startpos=1, endpos=4, fieldclass=Field)]
+        klass = generate_field_datensatz_class(felder1, 'KlassenNameABC')
+        instance1 = klass()
+        instance2 = klass()
+        self.assertTrue(instance1.feld1_field.field is instance2.feld1_field.field)
+        self.assertTrue(klass.feld1_field is klass.schema.fields[0][2])
+        self.assertFalse(hasattr(instance1, '__dict__'))
+        instance1.feld1 = 'foo'
+        self.assertEqual(instance1._values, ['foo'])
+        self.assertEqual(instance2.feld1, '')
+        self.assertEqual(klass.schema.fields[0][2].value, '')
 
     def test_fields(self):
         felder1 = [dict(name='feld1', length=3, startpos=1, endpos=4),
@@ -477,6 +575,40 @@ class FieldDatensatzBasic(unittest.TestCase):
         instance2.feld1 = 'bar'
         self.assertEqual(instance1.feld1, 'foo')
 
+    def test_schema(self):
+        """Test generate_field_datensatz_class() compiles an ordered field table."""
+        felder = [dict(name='feld2', length=5, startpos=10, endpos=15),
+                  dict(name='feld1', length=3, startpos=1, endpos=4, fieldclass=IntegerField)]
+        klass = generate_field_datensatz_class(felder, 'KlassenNameABC', length=20)
+        self.assertEqual(klass.schema.length, 20)
+        self.assertEqual(klass.schema.names, ('feld1', 'feld2'))
+        self.assertEqual([(start, end) for start, end, dummy in klass.schema.fields], [(1, 4), (10, 15)])
+        self.assertTrue(isinstance(klass.schema.fields[0][2], IntegerField))
+        self.assertTrue(isinstance(klass.schema.fields, tuple))
+
+    def test_splitter(self):
+        """Test records are cut into field data with a single struct call."""
+        felder = [dict(name='feld2', length=5, startpos=10, endpos=15),
+                  dict(name='feld1', length=3, startpos=1, endpos=4)]
+        klass = generate_field_datensatz_class(felder, 'KlassenNameABC', length=20)
+        self.assertEqual(klass.schema.splitter.format, '=1x3s6x5s5x')
+        self.assertEqual(klass.schema.split('0123456789ABCDEFGHIJ'), ('123', 'ABCDE'))
+        self.assertEqual(klass.schema.split(u'0123456789ABCDEFGHIJ'), [u'123', u'ABCDE'])
+
+    def test_template(self):
+        """Test FixedFields are formated into the template once."""
+        felder = [dict(length=3, startpos=0, endpos=3, name='satzart', fieldclass=FixedField, default='100'),
+                  dict(length=5, startpos=5, endpos=10, name='name')]
+        klass = generate_field_datensatz_class(felder, name='test12', length=12)
+        self.assertEqual(str(klass.schema.template), '100         ')
+        self.assertEqual([entry[:3] for entry in klass.schema.variable], [(5, 10, 1)])
+        instance = klass()
+        instance.name = 'abc'
+        self.assertEqual(instance.serialize(), '100  abc    ')
+        instance.name = u'\xe4bc'
+        self.assertEqual(instance.serialize(), u'100  \xe4bc    ')
+        self.assertEqual(str(klass.schema.template), '100         ')
+
     def test_lengthfehler(self):
         """Test that generate_field_datensatz_class() catches inconsitent field length information."""
         felder1 = [dict(name='feld1', length=1, startpos=0, endpos=0)]
@@ -581,6 +713,407 @@ class FieldDatensatzParseAndBack(unittest.TestCase):
         self.assertEqual(instance.int1, 2222222)
         self.assertEqual(instance.int2, 33333)
 
+    def test_from_data(self):
+        """Test creating records directly from data."""
+        felder = [dict(length=4, startpos=0, endpos=4, name='position'),
+                  dict(length=8, startpos=4, endpos=12, name='int1', fieldclass=IntegerField)]
+        klass = generate_field_datensatz_class(felder, name='test12', length=12)
+        instance = klass.from_data('9999     -17')
+        self.assertEqual(instance.position, '9999')
+        self.assertEqual(instance.int1, -17)
+        self.assertRaises(SizeMismatch, klass.from_data, '9999')
+
+    def test_parse_trusted(self):
+        """Test parsing without validating the fields."""
+        felder = [dict(length=3, startpos=0, endpos=3, name='satzart', fieldclass=FixedField, default='100'),
+                  dict(length=13, startpos=3, endpos=16, name='ean', fieldclass=EanField),
+                  dict(length=1, startpos=16, endpos=17, name='art', choices=['A', 'B']),
+                  dict(length=6, startpos=17, endpos=23, name='preis', fieldclass=DecimalFieldNoDot,
+                       precision=2)]
+        klass = generate_field_datensatz_class(felder, name='test12', length=23)
+        instance = klass.from_data('1004005998000014A  1250', validate=False)
+        self.assertEqual(instance.as_dict(), klass.from_data('1004005998000014A  1250').as_dict())
+        # invalid data is not noticed
+        self.assertRaises(InvalidData, klass.from_data, '1004005998000019C  1250')
+        instance = klass.from_data('2004005998000019C  1250', validate=False)
+        self.assertEqual((instance.satzart, instance.ean, instance.art), ('100', '4005998000019', 'C'))
+        # but data which can't be parsed still is
+        self.assertRaises(InvalidOperation, klass.from_data, '1004005998000014A  1a50', validate=False)
+
+    def test_from_values(self):
+        """Test creating records from a list of values."""
+        felder = [dict(length=4, startpos=0, endpos=4, name='position'),
+                  dict(length=8, startpos=4, endpos=12, name='int1', fieldclass=IntegerField)]
+        klass = generate_field_datensatz_class(felder, name='test12', length=12)
+        instance = klass.from_data('9999     -17')
+        copied = klass.from_values(instance._values)
+        self.assertEqual(copied.as_dict(), {'position': '9999', 'int1': -17})
+        self.assertEqual(copied.serialize(), '9999     -17')
+
+    def test_reuse(self):
+        """Test parsing into an existing record and resetting it."""
+        felder = [dict(length=4, startpos=0, endpos=4, name='position', default='0001'),
+                  dict(length=8, startpos=4, endpos=12, name='int1', fieldclass=IntegerField)]
+        klass = generate_field_datensatz_class(felder, name='test12', length=12)
+        instance = klass()
+        first = klass.parse_into('9999     -17', instance)
+        self.assertTrue(first is instance)
+        values = instance._values
+        klass.parse_into('8888      42', instance)
+        self.assertEqual((instance.position, instance.int1), ('8888', 42))
+        self.assertEqual(values, ['9999', -17])
+        klass.parse_into('7777      43', instance, lazy=True)
+        self.assertEqual(instance.int1, 43)
+        instance.reset()
+        self.assertEqual(instance.serialize(), '0001        ')
+        other = generate_field_datensatz_class(felder, name='test13', length=12)
+        self.assertRaises(TypeError, other.parse_into, '9999     -17', instance)
+        self.assertRaises(SizeMismatch, klass.parse_into, '9999', instance)
+
+    def test_patch(self):
+        """Test overwriting single fields of serialized records."""
+        felder = [dict(length=3, startpos=0, endpos=3, name='satzart', fieldclass=FixedField, default='100'),
+                  dict(length=4, startpos=3, endpos=7, name='referenz'),
+                  dict(length=1, startpos=7, endpos=8, name='test', choices=['0', '1']),
+                  dict(length=6, startpos=8, endpos=14, name='preis', fieldclass=DecimalFieldNoDot,
+                       precision=2)]
+        klass = generate_field_datensatz_class(felder, name='test12', length=14)
+        buf = bytearray('100ABCD1  1250\n100EFGH0  0050\n')
+        self.assertEqual(klass.patch(buf, 'referenz', 'X', offset=15), 'X   ')
+        klass.patch(buf, 'test', '0')
+        klass.patch(buf, 'preis', Decimal('7.5'), offset=15)
+        self.assertEqual(str(buf), '100ABCD0  1250\n100X   0   750\n')
+        self.assertEqual(klass.from_data(str(buf[15:29])).preis, Decimal('7.5'))
+        self.assertRaises(FieldNoValidChoice, klass.patch, buf, 'test', '2')
+        self.assertRaises(FieldTooLong, klass.patch, buf, 'referenz', 'ABCDE')
+        self.assertRaises(FieldImmutable, klass.patch, buf, 'satzart', '200')
+        self.assertRaises(InvalidFieldDefinition, klass.patch, buf, 'foo', '1')
+        self.assertRaises(SizeMismatch, klass.patch, buf, 'referenz', 'X', offset=20)
+        self.assertEqual(str(buf), '100ABCD0  1250\n100X   0   750\n')
+        # files can be patched via mmap
+        fileobj = tempfile.TemporaryFile()
+        fileobj.write('100ABCD1  1250\n')
+        fileobj.flush()
+        data = mmap.mmap(fileobj.fileno(), 0)
+        klass.patch(data, 'referenz', 'WXYZ')
+        data.close()
+        fileobj.seek(0)
+        self.assertEqual(fileobj.read(), '100WXYZ1  1250\n')
+
+    def test_validate_file(self):
+        """Test checking whole files without parsing them."""
+        felder = [dict(length=3, startpos=0, endpos=3, name='satzart', fieldclass=FixedField, default='100'),
+                  dict(length=13, startpos=3, endpos=16, name='ean', fieldclass=EanField),
+                  dict(length=1, startpos=16, endpos=17, name='art', choices=['A', 'B']),
+                  dict(length=6, startpos=17, endpos=23, name='preis', fieldclass=DecimalFieldNoDot,
+                       precision=2),
+                  dict(length=10, startpos=23, endpos=33, name='text')]
+        klass100 = generate_field_datensatz_class(felder, name='test12', length=33)
+        felder = [dict(length=3, startpos=0, endpos=3, name='satzart', fieldclass=FixedField, default='900'),
+                  dict(length=8, startpos=3, endpos=11, name='datum', fieldclass=DateField)]
+        klass900 = generate_field_datensatz_class(felder, name='test13', length=11)
+        classes = {'100': klass100, '900': klass900}
+        lines = ['1004005998000014A  1250foo', '1004005998000014A  1250', '', '9002010123',
+                 '1004005998000019C  1250', '1004005998000014B  1a50bar', '800', '90020101232',
+                 '100             A  0000']
+        self.assertEqual(validate_file('\n'.join(lines[:3]), classes, (0, 3), pad=True), [])
+        violations = validate_file('\n'.join(lines) + '\n', classes, (0, 3), pad=True)
+        self.assertEqual([violation[:3] for violation in violations],
+                         [(4, 4, 'datum'), (5, 4, 'ean'), (5, 17, 'art'), (6, 18, 'preis'), (7, 1, None),
+                          (8, 4, 'datum')])
+        self.assertEqual(violations[4][3], "unknown record type '800'")
+        # records following a line header
+        violations = validate_file([line and 'XX ' + line for line in lines], classes, (3, 6), offset=3,
+                                   pad=True)
+        self.assertEqual([violation[:3] for violation in violations][:2], [(4, 7, 'datum'), (5, 7, 'ean')])
+        # without pad lines have to match the length of their record like for from_data()
+        lines = ['1004005998000014A  1250foo       ', '100   17GARBAGE-EXTRA-BYTES', '100', '90020101231',
+                 '1004005998000014A  1250foo       EXTRA']
+        self.assertRaises(SizeMismatch, klass100.from_data, lines[1])
+        self.assertRaises(SizeMismatch, klass100.from_data, lines[4])
+        violations = validate_file('\n'.join(lines) + '\n', classes, (0, 3))
+        self.assertEqual([violation[:3] for violation in violations],
+                         [(2, 34, None), (3, 34, None), (5, 34, None)])
+        self.assertEqual(violations[1][3], "record has length 3 instead of 33")
+        violations = validate_file(['XX ' + line for line in lines], classes, (3, 6), offset=3)
+        self.assertEqual([violation[:3] for violation in violations],
+                         [(2, 37, None), (3, 37, None), (5, 37, None)])
+
+    def test_compiled(self):
+        """Test records with generated parse() and serialize() methods."""
+        felder = [dict(length=3, startpos=0, endpos=3, name='satzart', fieldclass=FixedField, default='100'),
+                  dict(length=13, startpos=3, endpos=16, name='ean', fieldclass=EanField),
+                  dict(length=1, startpos=16, endpos=17, name='art', choices=['A', 'B']),
+                  dict(length=6, startpos=17, endpos=23, name='preis', fieldclass=DecimalFieldNoDot,
+                       precision=2),
+                  dict(length=5, startpos=25, endpos=30, name='menge', fieldclass=IntegerField),
+                  dict(length=8, startpos=30, endpos=38, name='datum', fieldclass=DateField),
+                  dict(length=6, startpos=38, endpos=44, name='text-1 \'x\'\n', default='leer')]
+        generic = generate_field_datensatz_class(felder, name='test12', length=44)
+        klass = generate_field_datensatz_class(felder, name='test12', length=44, compiled=True)
+        self.assertEqual(generic._source, None)
+        self.assertTrue('def parse(self' in klass._source)
+        self.assertTrue(repr(felder[-1]['name']) in klass._source)
+        for data in ['1004005998000014A  1250     1720100101abc   ',
+                     '1004005998000014B  1250    -1720100101      ']:
+            instance = klass.from_data(data)
+            self.assertEqual(instance._values, generic.from_data(data)._values)
+            self.assertEqual(instance.serialize(), generic.from_data(data).serialize())
+        self.assertEqual(klass.from_data('1004005998000014A  1250     1720100101abc   ').serialize(),
+                         '1004005998000014A  1250     1720100101abc   ')
+        self.assertEqual(instance.serialize(), '1004005998000014B  1250    -1720100101leer  ')
+        # errors are raised like without compiling
+        for data in ['2004005998000014A  1250     1720100101abc   ',
+                     '1004005998000019A  1250     1720100101abc   ',
+                     '1004005998000014C  1250     1720100101abc   ',
+                     '1004005998000014A  1250     1.20100101abc   ',
+                     '1004005998000014A  1250     1720101301abc   ',
+                     '1004005998000014A  1250     1720100101abc']:
+            self.assertRaises(RecordBasedProtocolException, generic.from_data, data)
+            self.assertRaises(RecordBasedProtocolException, klass.from_data, data)
+        instance = klass.from_data('1004005998000014C  1250     1720100101abc   ', validate=False)
+        self.assertEqual(instance.art, 'C')
+        instance = klass.from_data('1004005998000014A  1250     1720100101abc   ', lazy=True)
+        self.assertEqual(instance.menge, 17)
+        instance._values[3] = 'abc'
+        self.assertRaises(ValueError, instance.serialize)
+        instance = klass()
+        instance.ean = u'4005998000014'
+        self.assertEqual(instance.serialize(), generic.from_values(instance._values).serialize())
+        self.assertTrue(isinstance(instance.serialize(), unicode))
+        self.assertTrue(klass.projection(['menge'])._source)
+
+    def test_projection(self):
+        """Test records parsing only some fields."""
+        felder = [dict(length=4, startpos=0, endpos=4, name='position'),
+                  dict(length=8, startpos=4, endpos=12, name='int1', fieldclass=IntegerField)]
+        klass = generate_field_datensatz_class(felder, name='test12', length=12)
+        projected = klass.projection(['int1'])
+        self.assertTrue(projected is klass.projection(['int1']))
+        self.assertEqual(projected.length, 12)
+        instance = projected.from_data('XXXX     -17')
+        self.assertEqual(instance.int1, -17)
+        self.assertRaises(AttributeError, getattr, instance, 'position')
+        self.assertRaises(InvalidFieldDefinition, klass.projection, ['foo'])
+
+    def test_parse_lazy(self):
+        """Test lazy parsing decodes fields on access."""
+        felder = [
+            dict(length=4, startpos=0, endpos=4, name='position'),
+            dict(length=8, startpos=4, endpos=12, name='date', fieldclass=DateField),
+            dict(length=8, startpos=12, endpos=20, name='int1', fieldclass=IntegerField),
+            ]
+        klass = generate_field_datensatz_class(felder, name='test12', length=20)
+        instance = klass()
+        instance.parse('999920060506     -17', lazy=True)
+        self.assertEqual(instance.int1, -17)
+        self.assertEqual(instance.as_dict(), {'position': '9999', 'date': datetime.date(2006, 5, 6),
+                                              'int1': -17})
+        self.assertEqual(instance.serialize(), '999920060506     -17')
+
+        # errors show up on access or when calling validate_all()
+        instance.parse('999920061306     -17', lazy=True)
+        self.assertEqual(instance.position, '9999')
+        self.assertRaises(InvalidData, getattr, instance, 'date')
+        instance.parse('999920061306     -17', lazy=True)
+        self.assertRaises(InvalidData, instance.validate_all)
+        self.assertRaises(SizeMismatch, instance.parse, '9999', lazy=True)
+
+        # repr() and pretty() show invalid data instead of raising
+        instance.parse('999920061306     -17', lazy=True)
+        self.assertEqual(repr(instance),
+                         "<test12: <position: '9999'>, <date: invalid '20061306'>, <int1: -17>>")
+        self.assertEqual(instance.pretty(), repr(instance))
+        self.assertRaises(InvalidData, getattr, instance, 'date')
+        instance.parse('            0000    ', lazy=True)
+        self.assertEqual(instance.pretty(), "<test12: <int1: 0>>")
+
+    def test_scaled(self):
+        """Test record classes with scaled DecimalFields."""
+        felder = [dict(length=4, startpos=0, endpos=4, name='position'),
+                  dict(length=6, startpos=4, endpos=10, name='preis', fieldclass=DecimalFieldNoDot,
+                       precision=2),
+                  dict(length=6, startpos=10, endpos=16, name='menge', fieldclass=DecimalFieldNoDot,
+                       precision=3)]
+        klass = generate_field_datensatz_class(felder, name='test12', length=16)
+        scaledklass = klass.scaled(['preis'])
+        self.assertTrue(scaledklass is klass.scaled(['preis']))
+        instance = scaledklass.from_data('0001  1250  2000')
+        self.assertEqual(instance.preis, 1250)
+        self.assertEqual(instance.menge, Decimal('2'))
+        instance.preis = 99
+        self.assertEqual(instance.serialize(), '0001   099  2000')
+        self.assertEqual(klass.scaled().from_data('0001  1250  2000').menge, 2000)
+        projected = scaledklass.projection(['preis'])
+        self.assertEqual(projected.from_data('0001  1250  2000').as_dict(), {'preis': 1250})
+        self.assertRaises(InvalidFieldDefinition, klass.scaled, ['position'])
+        copied = pickle.loads(pickle.dumps(instance))
+        self.assertTrue(type(copied) is scaledklass)
+        self.assertEqual(copied.preis, 99)
+
+    def test_pickle(self):
+        """Test pickling records of generated classes."""
+        felder = [dict(length=4, startpos=0, endpos=4, name='position'),
+                  dict(length=8, startpos=4, endpos=12, name='int1', fieldclass=IntegerField)]
+        klass = generate_field_datensatz_class(felder, name='pickletest', length=12)
+        instance = klass.from_data('9999     -17')
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copied = pickle.loads(pickle.dumps(instance, protocol))
+            self.assertTrue(type(copied) is klass)
+            self.assertEqual(copied.as_dict(), {'position': '9999', 'int1': -17})
+
+        # lazily parsed records are transferred as raw data
+        copied = pickle.loads(pickle.dumps(klass.from_data('9999      -1', lazy=True)))
+        self.assertEqual(copied.int1, -1)
+        # fields changed after a lazy parse are kept
+        instance = klass.from_data('9999     -17', lazy=True)
+        instance.int1 = 5
+        copied = pickle.loads(pickle.dumps(instance))
+        self.assertEqual((copied.position, copied.int1), ('9999', 5))
+        copied = pickle.loads(pickle.dumps(klass.projection(['int1']).from_data('9999     -17')))
+        self.assertTrue(type(copied) is klass.projection(['int1']))
+        self.assertEqual(copied.as_dict(), {'int1': -17})
+
+        # a class with the same name but an other layout gets an other name
+        otherklass = generate_field_datensatz_class(felder[:1], name='pickletest', length=12)
+        self.assertNotEqual(otherklass._qualname, klass._qualname)
+        copied = pickle.loads(pickle.dumps(otherklass.from_data('9999        ')))
+        self.assertTrue(type(copied) is otherklass)
+        self.assertTrue(type(pickle.loads(pickle.dumps(instance))) is klass)
+        # the names don't depend on the order the classes are generated in
+        first = generate_field_datensatz_class(felder, name='ordertest1', length=12)
+        second = generate_field_datensatz_class(felder[:1], name='ordertest1', length=12)
+        reversedsecond = generate_field_datensatz_class(felder[:1], name='ordertest2', length=12)
+        reversedfirst = generate_field_datensatz_class(felder, name='ordertest2', length=12)
+        self.assertEqual(first._qualname.split('#')[1], reversedfirst._qualname.split('#')[1])
+        self.assertEqual(second._qualname.split('#')[1], reversedsecond._qualname.split('#')[1])
+        # a compiled class doesn't take over the name of the generic one
+        compiledklass = generate_field_datensatz_class(felder, name='pickletest', length=12, compiled=True)
+        self.assertNotEqual(compiledklass._qualname, klass._qualname)
+        self.assertTrue(type(pickle.loads(pickle.dumps(instance))) is klass)
+        copied = pickle.loads(pickle.dumps(compiledklass.from_data('9999     -17')))
+        self.assertTrue(type(copied) is compiledklass)
+
+
+class ColumnParsing(unittest.TestCase):
+    """Test for parse_columns() and columns_as_arrays()."""
+
+    felder = [
+        dict(length=4, startpos=0, endpos=4, name='position'),
+        dict(length=8, startpos=4, endpos=12, name='date', fieldclass=DateField),
+        dict(length=8, startpos=12, endpos=20, name='menge', fieldclass=IntegerField),
+        dict(length=8, startpos=20, endpos=28, name='preis', fieldclass=DecimalField, precision=2),
+        ]
+    lines = ['000120060506     -17   12.50',
+             '000220070102       4    1.25']
+
+    def test_parse_columns(self):
+        """Test parsing many records into columns."""
+        klass = generate_field_datensatz_class(self.felder, name='test12', length=28)
+        columns = parse_columns(klass, self.lines)
+        self.assertEqual(sorted(columns.keys()), ['date', 'menge', 'position', 'preis'])
+        self.assertEqual(columns['position'], ['0001', '0002'])
+        self.assertEqual(columns['date'], [datetime.date(2006, 5, 6), datetime.date(2007, 1, 2)])
+        self.assertEqual(columns['menge'], [-17, 4])
+        self.assertEqual(sum(columns['preis']), Decimal('13.75'))
+        columns = parse_columns(klass, self.lines, names=['menge'])
+        self.assertEqual(columns, {'menge': [-17, 4]})
+        self.assertRaises(InvalidFieldDefinition, parse_columns, klass, self.lines, names=['foo'])
+        self.assertRaises(SizeMismatch, parse_columns, klass, ['0001'])
+
+    def test_columns_as_arrays(self):
+        """Test converting columns to arrays."""
+        klass = generate_field_datensatz_class(self.felder, name='test12', length=28)
+        arrays = columns_as_arrays(parse_columns(klass, self.lines))
+        self.assertEqual(sum(arrays['menge']), -13)
+        self.assertEqual(list(arrays['position']), ['0001', '0002'])
+
+
+class NumpyRecords(unittest.TestCase):
+    """Test for the NumPy view on fixed-width data."""
+
+    felder = [
+        dict(length=4, startpos=0, endpos=4, name='position', fieldclass=IntegerField),
+        dict(length=8, startpos=4, endpos=12, name='date', fieldclass=DateField),
+        dict(length=6, startpos=12, endpos=18, name='betrag', fieldclass=DecimalFieldNoDotSigned,
+             precision=2),
+        dict(length=5, startpos=18, endpos=23, name='preis', fieldclass=DecimalFieldNoDot, precision=2),
+        ]
+    data = '000120060506 1250- 1234\n   2        00004+00001\n00039999999900000+ 0000'
+
+    @unittest.skipIf(numpy is None, 'NumPy not installed')
+    def test_numpy_records(self):
+        """Test viewing records as NumPy structured array."""
+        klass = generate_field_datensatz_class(self.felder, name='test12', length=23)
+        records = numpy_records(klass, self.data)
+        self.assertEqual(len(records), 3)
+        self.assertEqual(list(records['preis']), [' 1234', '00001', ' 0000'])
+        self.assertEqual(list(numpy_column(klass, records, 'position')), [1, 2, 3])
+        self.assertEqual(list(numpy_column(klass, records, 'betrag', scaled=True)), [-1250, 4, 0])
+        self.assertEqual(list(numpy_column(klass, records, 'preis', scaled=True)), [1234, 1, 0])
+        self.assertEqual(numpy_column(klass, records, 'preis')[0], 12.34)
+        dates = numpy_column(klass, records, 'date')
+        self.assertEqual(str(dates[0]), '2006-05-06')
+        self.assertTrue(numpy.isnat(dates[1]) and numpy.isnat(dates[2]))
+        self.assertRaises(SizeMismatch, numpy_records, klass, self.data[:-1])
+        # invalid days and signs are rejected like by the fields
+        records = numpy_records(klass, self.data.replace('20060506', '20100230'))
+        self.assertRaises(InvalidData, numpy_column, klass, records, 'date')
+        records = numpy_records(klass, self.data.replace('20060506', '20100231'))
+        self.assertRaises(InvalidData, numpy_column, klass, records, 'date')
+        records = numpy_records(klass, self.data.replace('20060506', '20120229'))
+        self.assertEqual(str(numpy_column(klass, records, 'date')[0]), '2012-02-29')
+        records = numpy_records(klass, self.data.replace('00004+', '00125*'))
+        self.assertRaises(InvalidData, numpy_column, klass, records, 'betrag')
+
+
+class LineReading(unittest.TestCase):
+    """Test for iter_offsets(), iter_lines() and mmap_lines()."""
+
+    def test_iter_lines(self):
+        """Test iterating over lines without splitting the data."""
+        self.assertEqual(list(iter_offsets('ab\ncde\n\nf')), [(0, 2), (3, 6), (7, 7), (8, 9)])
+        self.assertEqual(list(iter_lines('ab\ncde\n\nf\n')), ['ab', 'cde', '', 'f'])
+        self.assertEqual(list(iter_lines(['ab', 'cd'])), ['ab', 'cd'])
+        self.assertEqual(list(iter_lines('')), [])
+
+    def test_mmap_lines(self):
+        """Test reading lines from a memory mapped file."""
+        fileobj = tempfile.NamedTemporaryFile()
+        self.assertEqual(list(mmap_lines(fileobj.name)), [])
+        fileobj.write('0001\r\n0002\r\n0003')
+        fileobj.flush()
+        self.assertEqual(list(mmap_lines(fileobj.name)), ['0001\r', '0002\r', '0003'])
+        fileobj.close()
+
+
+class Indexing(unittest.TestCase):
+    """Test for build_index() and RecordIndex."""
+
+    data = '000header\n100first\n500pos\n\n100second\n500pos\n900sum\n'
+
+    def test_build_index(self):
+        """Test building an index and accessing messages with it."""
+        index = build_index(self.data, (0, 3), ['100'])
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.satzarten['500'], [19, 37])
+        self.assertEqual(index.get_message(self.data, 0), '000header\n100first\n500pos\n\n')
+        self.assertEqual(index.get_message(self.data, 1, with_header=False), '100second\n500pos\n900sum\n')
+        fileobj = tempfile.TemporaryFile()
+        fileobj.write(self.data)
+        self.assertEqual(index.get_message(fileobj, 1), '000header\n100second\n500pos\n900sum\n')
+
+    def test_save_and_load(self):
+        """Test keeping an index in a sidecar file."""
+        index = build_index(self.data, (0, 3), ['100'])
+        fileobj = tempfile.NamedTemporaryFile()
+        index.save(fileobj.name)
+        loaded = RecordIndex.load(fileobj.name)
+        self.assertEqual(loaded.satzarten, index.satzarten)
+        self.assertEqual(loaded.messages, index.messages)
+        self.assertEqual(loaded.header, index.header)
+        self.assertEqual(loaded.size, len(self.data))
+
 
 if __name__ == '__main__':
     unittest.main()
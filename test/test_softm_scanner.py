@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+test_softm_scanner.py - tests for edilib.softm.scanner on synthetic SoftM EDI files
+
+Copyright (c) 2010 HUDORA. All rights reserved.
+"""
+
+import datetime
+import unittest
+from decimal import Decimal
+from edilib.softm import structure
+from edilib.softm.scanner import scan_invoices
+from test_softm_structure import softm_line, invoice_lines
+
+
+class InvoiceScanning(unittest.TestCase):
+    """Test for scan_invoices()."""
+
+    def test_scan_invoices(self):
+        """Test summarizing invoices, including one without F9 at the end of the file."""
+        lines = [softm_line('XH', structure.XHsatzklasse())]
+        lines.extend(invoice_lines(1001, gesamtbetrag=Decimal('12.34')))
+        lines.extend(invoice_lines(1002, positionen=0, gesamtbetrag=Decimal('-5')))
+        # the last invoice is cut off before its F9
+        lines.extend(invoice_lines(1003)[:-1])
+        summaries = list(scan_invoices('\n'.join(lines) + '\n'))
+        self.assertEqual(summaries, [
+            dict(rechnungsnr=1001, rechnungsdatum=datetime.date(2010, 1, 22), rechnungsempfaenger=17200,
+                 gesamtbetrag=Decimal('12.34')),
+            dict(rechnungsnr=1002, rechnungsdatum=datetime.date(2010, 1, 23), rechnungsempfaenger=17200,
+                 gesamtbetrag=Decimal('-5')),
+            dict(rechnungsnr=1003, rechnungsdatum=datetime.date(2010, 1, 24), rechnungsempfaenger=17200,
+                 gesamtbetrag=None)])
+
+    def test_skip_other_satzarten(self):
+        """Test that lines of other satzarten - even unknown ones - are not looked at."""
+        lines = invoice_lines(1001)
+        lines.insert(1, lines[1][:19] + 'Q7' + 'kaputt')
+        lines.insert(0, 'EDI' + '0' * 16 + 'XHkaputt')
+        lines.append('\x1a')
+        summaries = list(scan_invoices(lines))
+        self.assertEqual([(summary['rechnungsnr'], summary['gesamtbetrag']) for summary in summaries],
+                         [(1001, Decimal('12.34'))])
+        self.assertEqual(list(scan_invoices([])), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+test_softm_structure.py - tests for edilib.softm.structure on synthetic SoftM EDI files
+
+Copyright (c) 2010 HUDORA. All rights reserved.
+"""
+
+import datetime
+import pickle
+import unittest
+from decimal import Decimal
+from edilib.recordbased import DecimalField, IntegerField
+from edilib.softm import structure
+
+
+def softm_line(satzart, record):
+    """Returns record as line of a SoftM EDI file, filling fields which can't be parsed when empty."""
+    for index, (dummy, dummy, field) in enumerate(record.schema.fields):
+        if record._values[index] == '':
+            if field.choices:
+                record._values[index] = field.choices[0]
+            elif isinstance(field, (DecimalField, IntegerField)):
+                record._values[index] = 1
+    return 'EDI' + '0' * 16 + satzart + '00' + record.serialize() + '20101010'
+
+
+def invoice_lines(rechnungsnr, positionen=2, gesamtbetrag=Decimal('12.34')):
+    """Returns the lines of a synthetic invoice."""
+    f1 = structure.F1satzklasse()
+    f1.rechnungsnr = rechnungsnr
+    f1.rechnungsdatum = datetime.date(2010, 1, 1 + rechnungsnr % 28)
+    f1.rechnungsempfaenger = '17200'
+    lines = [softm_line('F1', f1), softm_line('FA', structure.FAsatzklasse())]
+    for dummy in range(positionen):
+        lines.append(softm_line('F3', structure.F3satzklasse()))
+        lines.append(softm_line('F4', structure.F4satzklasse()))
+    f9 = structure.F9satzklasse()
+    f9.gesamtbetrag = gesamtbetrag
+    lines.append(softm_line('F9', f9))
+    return lines
+
+
+def sample(invoices=10):
+    """Returns the lines of a synthetic SoftM EDI file."""
+    lines = [softm_line('XH', structure.XHsatzklasse())]
+    for rechnungsnr in range(invoices):
+        lines.extend(invoice_lines(1000 + rechnungsnr))
+    return lines
+
+
+class Projection(unittest.TestCase):
+    """Test for iter_objects() with a projection."""
+
+    def test_projection(self):
+        """Test parsing only some satzarten and fields."""
+        lines = sample(3)
+        records = list(structure.iter_objects(lines, projection={'F1': ['rechnungsnr'], 'F9': None}))
+        self.assertEqual([satzart for satzart, dummy in records], ['F1', 'F9'] * 3)
+        self.assertEqual([satz.rechnungsnr for satzart, satz in records if satzart == 'F1'],
+                         [1000, 1001, 1002])
+        self.assertRaises(AttributeError, getattr, records[0][1], 'rechnungsdatum')
+        self.assertEqual(records[1][1].as_dict(),
+                         structure.F9satzklasse.from_data(lines[7][23:519]).as_dict())
+        self.assertRaises(ValueError, list, structure.iter_objects(lines, projection={'Q7': None}))
+
+    def test_projection_skips_lines(self):
+        """Test that lines of other satzarten are skipped without looking further at them."""
+        lines = sample(1)
+        # unknown and broken lines don't matter as long as they are not projected
+        lines.insert(2, lines[2][:19] + 'Q7' + lines[2][21:])
+        lines.insert(3, lines[3][:19] + 'F3' + 'kaputt' + lines[3][27:])
+        records = list(structure.iter_objects(lines, projection={'F9': ['gesamtbetrag']}))
+        self.assertEqual([(satzart, satz.gesamtbetrag) for satzart, satz in records],
+                         [('F9', Decimal('12.34'))])
+        self.assertRaises(RuntimeError, list, structure.iter_objects(lines))
+        # lines which split_line() shifts are still parsed like before
+        records = list(structure.iter_objects(lines[:-1] + [' ' + lines[-1]], projection={'F9': None}))
+        self.assertEqual([satzart for satzart, dummy in records], ['F9'])
+
+
+class Pickling(unittest.TestCase):
+    """Test pickling SoftM records."""
+
+    def test_text_classes(self):
+        """Test that text records with the same layout come back as their own class."""
+        satzresolver = structure.get_satzresolver()
+        names = set()
+        for satzart in ['AK', 'AP', 'AR', 'AX', 'FK', 'FP', 'FR', 'FX', 'FE']:
+            klass = satzresolver[satzart]
+            names.add(klass._qualname)
+            copied = pickle.loads(pickle.dumps(klass.from_data(' ' * 496)))
+            self.assertTrue(type(copied) is klass)
+        self.assertEqual(len(names), 9)
+
+
+class SatzartPeeking(unittest.TestCase):
+    """Test for peek_satzart()."""
+
+    def test_peek_satzart(self):
+        """Test that peek_satzart() only answers for lines split_line() doesn't shift."""
+        line = sample(1)[1]
+        self.assertEqual(structure.peek_satzart(line), 'F1')
+        self.assertEqual(structure.peek_satzart(line + '\r\n'), 'F1')
+        self.assertEqual(structure.peek_satzart(line[:19] + 'Q7' + line[21:]), 'Q7')
+        # the last byte of the record may be blank as long as the erstellungsdatum follows
+        self.assertEqual(structure.peek_satzart(line[:518] + ' 20101010\n'), 'F1')
+        for shifted in [' ' + line, '\x1a' + line, line[:300], line[:518] + ' \x1a\r\n', line[:518] + '\n',
+                        '', '\x1a', '\n']:
+            self.assertEqual(structure.peek_satzart(shifted), None)
+
+
+class ParallelParsing(unittest.TestCase):
+    """Test for parse_to_objects() with several processes."""
+
+    def test_parallel(self):
+        """Test that parsing in chunks by several processes yields the same as parsing serially."""
+        data = '\n'.join(sample()) + '\n'
+        serial = structure.parse_to_objects(data)
+        parallel = structure.parse_to_objects(data, parallel=2, chunksize=7)
+        self.assertTrue(len(serial) > 3 * 7)
+        self.assertEqual([satzart for satzart, dummy in parallel], [satzart for satzart, dummy in serial])
+        self.assertEqual([satz.as_dict() for dummy, satz in parallel],
+                         [satz.as_dict() for dummy, satz in serial])
+        self.assertEqual([type(satz) for dummy, satz in parallel], [type(satz) for dummy, satz in serial])
+
+    def test_parallel_unknown_satzart(self):
+        """Test that an unknown satzart in a worker process is raised in the calling process."""
+        lines = sample()
+        lines.insert(20, lines[20][:19] + 'Q7' + lines[20][21:])
+        self.assertRaises(RuntimeError, structure.parse_to_objects, lines)
+        self.assertRaises(RuntimeError, structure.parse_to_objects, lines, parallel=2, chunksize=7)
+
+
+class FileValidation(unittest.TestCase):
+    """Test for validate_file()."""
+
+    def test_validate_file(self):
+        """Test that validate_file() sees the lines like the parser does."""
+        lines = sample(2)
+        self.assertEqual(structure.validate_file(lines), [])
+        # a truncated line is padded at the beginning by split_line(), which hides its satzart
+        lines[0] = lines[0][:300]
+        self.assertRaises(RuntimeError, structure.parse_to_objects, lines)
+        self.assertEqual([violation[:3] for violation in structure.validate_file(lines)], [(1, 20, None)])
+        # columns count from the beginning of the line
+        schema = structure.F1satzklasse.schema
+        startpos, endpos, dummy = schema.fields[schema.index['rechnungsdatum']]
+        lines[1] = lines[1][:23 + startpos] + '20101301' + lines[1][23 + endpos:]
+        self.assertEqual([violation[:3] for violation in structure.validate_file(lines)],
+                         [(1, 20, None), (2, 23 + startpos + 1, 'rechnungsdatum')])
+
+
+if __name__ == '__main__':
+    unittest.main()